@@ -1,22 +1,44 @@
 #!/usr/bin/env python3
 
 import signal
+import asyncio
 import time
 import logging
-import pygame
 import re
-from gpiozero import Button,PWMLED,LED
+import os
+import mmap
+import struct
+import array
+import sys
+import argparse
+import bisect
+import queue
+import tempfile
+import tracemalloc
+import cProfile
+import io
+import wave
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import OrderedDict
 from ctypes import cdll, byref, create_string_buffer
-from math import exp
-from neopixel import Adafruit_NeoPixel, Color
+from math import exp, ceil
 
 logger = logging.getLogger()
-#handler = logging.FileHandler("/var/log/falcon-service")
 formatter = logging.Formatter("%(asctime)s %(name)-12s %(levelname)-8s %(message)s")
-#handler.setFormatter(formatter)
-#logger.addHandler(handler)
 logger.addHandler(logging.StreamHandler())
-logger.setLevel(logging.DEBUG)
+logger.setLevel(logging.INFO)
+
+def configureLogging(level, fileName):
+	logger.setLevel(level)
+	
+	if fileName is not None:
+		handler = logging.FileHandler(fileName)
+		handler.setFormatter(formatter)
+		logger.addHandler(handler)
 
 def setprocessname(processname):	
 	libc = cdll.LoadLibrary('libc.so.6')
@@ -24,27 +46,866 @@ def setprocessname(processname):
 	buff.value = processname
 	libc.prctl(15, byref(buff), 0, 0, 0)
 
-logger.debug("set process name")
-setprocessname(b"falcon-service")
+class EventQueue:
+	START_PRESSED = 'start-pressed'
+	START_RELEASED = 'start-released'
+	STOP = 'stop'
+	LIBRARY_CHANGED = 'library-changed'
+	CONTROL = 'control'
+	TOGGLE_PROFILER = 'toggle-profiler'
+	
+	def __init__(self):
+		# a SimpleQueue can be filled from signal handlers and gpiozero threads alike
+		self._queue = queue.SimpleQueue()
+		
+	def put(self, event):
+		self._queue.put(event)
+		
+	def wait(self, timeout):
+		try:
+			return self._queue.get(timeout=timeout)
+		except queue.Empty:
+			return None
 
 class SignalHandler:
 	_shouldStop = False
 	
-	def __init__(self):
+	def __init__(self, events, trace, traceFileName):
+		self._events = events
+		self._trace = trace
+		self._traceFileName = traceFileName
 		signal.signal(signal.SIGINT, self.stop)
 		signal.signal(signal.SIGTERM, self.stop)
+		signal.signal(signal.SIGUSR1, self.dumpTrace)
+		signal.signal(signal.SIGUSR2, self.toggleProfiler)
 
 	def stop(self, signum, frame):
 		logger.info("received signal to stop")
 		self._shouldStop = True
+		self._events.put(EventQueue.STOP)
+		
+	def dumpTrace(self, signum, frame):
+		logger.info("received signal to dump the trace into " + self._traceFileName)
+		self._trace.dump(self._traceFileName)
+		
+	def toggleProfiler(self, signum, frame):
+		# cProfile has to be enabled on the main loop, so the signal only posts an event
+		logger.info("received signal to toggle the profiler")
+		self._events.put(EventQueue.TOGGLE_PROFILER)
 		
 	def checkIfShouldBeStopped(self):
 		return self._shouldStop
 		
-class AudioPlayer:
+class TraceBuffer:
+	SEQUENCE_START = 0
+	SEQUENCE_END = 1
+	STEP = 2
+	STEP_APPLIED = 3
+	WAIT = 4
+	STOP_BY_USER = 5
+	STOP_BY_SIGNAL = 6
+	DROPPED = 7
+	STRETCHED = 8
+	_eventNames = ['sequence-start', 'sequence-end', 'step', 'step-applied', 'wait', 'stop-by-user', 'stop-by-signal', 'dropped', 'stretched']
+	
+	def __init__(self, capacity):
+		self._capacity = capacity
+		self._timestamps = array.array('q', bytes(8*capacity))
+		self._events = array.array('B', bytes(capacity))
+		self._values = array.array('q', bytes(8*capacity))
+		self._recordCount = 0
+		
+	def record(self, event, value):
+		index = self._recordCount % self._capacity
+		self._timestamps[index] = time.monotonic_ns()
+		self._events[index] = event
+		self._values[index] = value
+		self._recordCount += 1
+		
+	def dump(self, fileName):
+		recordCount = self._recordCount
+		first = max(recordCount - self._capacity, 0)
+		
+		# the dump runs in a signal handler, so a failure must not reach the playback
+		try:
+			with open(fileName, 'w') as traceFile:
+				traceFile.write('# timestamp in ns;event;value\n')
+				for i in range(first, recordCount):
+					index = i % self._capacity
+					traceFile.write(str(self._timestamps[index]) + ';' + self._eventNames[self._events[index]] + ';' + str(self._values[index]) + '\n')
+		except OSError as e:
+			logger.error('failed to dump the trace into ' + fileName + ': ' + str(e))
+			return
+		
+		logger.info('dumped ' + str(recordCount - first) + ' of ' + str(recordCount) + ' trace records')
+		
+class DisabledTraceBuffer:
+	def record(self, event, value):
+		pass
+		
+	def dump(self, fileName):
+		logger.info('tracing is disabled, nothing to dump')
+		
+class Profiler:
+	# nothing is hooked into the interpreter until profiling is started, cProfile only
+	# covers the main thread while sampling covers every thread as collapsed stacks
+	CPROFILE = 'cprofile'
+	SAMPLING = 'sampling'
+	modes = [CPROFILE, SAMPLING]
+	_memoryTraceFrameCount = 16
+	
+	def __init__(self, mode, directory, samplingIntervalInSeconds):
+		if mode not in self.modes:
+			raise ValueError('the profiler mode must be one of ' + ', '.join(self.modes))
+		self._mode = mode
+		self._directory = directory
+		self._samplingInterval = samplingIntervalInSeconds
+		self._profile = None
+		self._sampler = None
+		self._samplerStopped = threading.Event()
+		self._stacks = {}
+		self._memoryTracingStarted = False
+		
+	def isRunning(self):
+		return self._profile is not None or self._sampler is not None
+		
+	def toggle(self):
+		if self.isRunning():
+			self.stop()
+		else:
+			self.start()
+		
+	def start(self):
+		if self.isRunning():
+			return
+		logger.info('starting the ' + self._mode + ' profiler')
+		if self._mode == self.CPROFILE:
+			self._profile = cProfile.Profile()
+			self._profile.enable()
+		else:
+			self._stacks = {}
+			self._samplerStopped.clear()
+			self._sampler = threading.Thread(target=self.__sample, name='profiler', daemon=True)
+			self._sampler.start()
+		
+	def stop(self):
+		if not self.isRunning():
+			return
+		# the profiler is stopped in any case, a profile which cannot be written is lost
+		if self._profile is not None:
+			profile = self._profile
+			self._profile = None
+			profile.disable()
+			fileName = self.__getFileName('profile', 'pstats')
+			try:
+				profile.dump_stats(fileName)
+			except OSError:
+				logger.exception('failed to write the profile to ' + fileName)
+				return
+		else:
+			self._samplerStopped.set()
+			self._sampler.join()
+			self._sampler = None
+			fileName = self.__getFileName('profile', 'collapsed')
+			try:
+				with open(fileName, 'w') as profileFile:
+					for stack, count in sorted(self._stacks.items()):
+						profileFile.write(';'.join(stack) + ' ' + str(count) + '\n')
+			except OSError:
+				logger.exception('failed to write the profile to ' + fileName)
+				return
+		logger.info('wrote the profile to ' + fileName)
+		
+	def snapshotMemory(self):
+		# the first call starts tracing and the second takes the snapshot, tracing slows down
+		# every allocation, so it is stopped again unless it was started outside the profiler
+		if not tracemalloc.is_tracing():
+			tracemalloc.start(self._memoryTraceFrameCount)
+			self._memoryTracingStarted = True
+			logger.info('started tracing memory allocations until the next snapshot, which shows where memory was allocated since')
+			return
+		snapshot = tracemalloc.take_snapshot()
+		tracedMemory = tracemalloc.get_traced_memory()[0]
+		if self._memoryTracingStarted:
+			tracemalloc.stop()
+			self._memoryTracingStarted = False
+		fileName = self.__getFileName('memory', 'tracemalloc')
+		try:
+			snapshot.dump(fileName)
+		except OSError:
+			logger.exception('failed to write the memory snapshot to ' + fileName)
+			return
+		logger.info('wrote the memory snapshot to ' + fileName + ', ' + str(tracedMemory) + ' bytes traced')
+		for statistic in snapshot.statistics('lineno')[:10]:
+			logger.info('allocated ' + str(statistic.size) + ' bytes in ' + str(statistic.count) + ' blocks at ' + str(statistic.traceback))
+		
+	def __sample(self):
+		sampler = threading.get_ident()
+		while not self._samplerStopped.wait(self._samplingInterval):
+			threadNames = {x.ident: x.name for x in threading.enumerate()}
+			for threadId, frame in sys._current_frames().items():
+				if threadId == sampler:
+					continue
+				stack = []
+				while frame is not None:
+					stack.append(os.path.basename(frame.f_code.co_filename) + ':' + frame.f_code.co_name)
+					frame = frame.f_back
+				stack.append(threadNames.get(threadId, str(threadId)))
+				stack = tuple(reversed(stack))
+				self._stacks[stack] = self._stacks.get(stack, 0) + 1
+		
+	def __getFileName(self, kind, extension):
+		return os.path.join(self._directory, 'falcon-' + kind + '-' + time.strftime('%Y%m%d-%H%M%S') + '.' + extension)
+		
+class Histogram:
+	# all histograms hold durations in nanoseconds, from 1us up to 10s
+	_upperBoundsInNanoseconds = [x*1000 for x in [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000, 1000000, 2000000, 5000000, 10000000]]
+	
+	def __init__(self):
+		self._upperBounds = self._upperBoundsInNanoseconds
+		self._counts = array.array('Q', bytes(8*(len(self._upperBounds) + 1)))
+		self._count = 0
+		self._sum = 0
+		self._maximum = 0
+		
+	def add(self, value):
+		bucket = bisect.bisect_left(self._upperBounds, value)
+		self._counts[bucket] += 1
+		self._count += 1
+		self._sum += value
+		if value > self._maximum:
+			self._maximum = value
+			
+	def getUpperBounds(self):
+		return self._upperBounds
+		
+	def getCounts(self):
+		return self._counts
+		
+	def getCount(self):
+		return self._count
+		
+	def getSum(self):
+		return self._sum
+		
+	def getMaximum(self):
+		return self._maximum
+		
+	def getMean(self):
+		if self._count == 0:
+			return 0
+		return self._sum/self._count
+		
+	def getPercentile(self, percentile):
+		if self._count == 0:
+			return 0
+		
+		threshold = self._count*percentile/100
+		cumulativeCount = 0
+		for i in range(len(self._upperBounds)):
+			cumulativeCount += self._counts[i]
+			if cumulativeCount >= threshold:
+				return min(self._upperBounds[i], self._maximum)
+		return self._maximum
+		
+	def describe(self):
+		return 'mean ' + '{:.3f}'.format(self.getMean()/1000000) + 'ms, 99th percentile below ' + '{:.3f}'.format(self.getPercentile(99)/1000000) + 'ms, maximum ' + '{:.3f}'.format(self._maximum/1000000) + 'ms'
+		
+class MetricCounter:
 	def __init__(self):
+		self._value = 0
+		
+	def increment(self, value=1):
+		self._value += value
+		
+	def get(self):
+		return self._value
+		
+class Metrics:
+	# counters and histograms over the lifetime of the service, the values are in nanoseconds
+	# and exported in seconds as prometheus expects, the components record into them directly
+	def __init__(self):
+		self._metrics = []
+		self.frameBuildTime = self.__addHistogram('falcon_frame_build_seconds', 'time to build a frame of the sequence and hand it to the renderer')
+		self.renderTime = self.__addHistogram('falcon_frame_render_seconds', 'time to write a frame to the pwm outputs and the drive')
+		self.renderLatency = self.__addHistogram('falcon_frame_render_latency_seconds', 'time from building a frame until it was written to the outputs')
+		self.lateness = self.__addHistogram('falcon_frame_lateness_seconds', 'delay of each shown frame after its deadline')
+		self.audioAnalysisTime = self.__addHistogram('falcon_audio_analysis_seconds', 'time to analyze the audio for one frame of the drive')
+		self.audioStartLatency = self.__addHistogram('falcon_audio_start_latency_seconds', 'time to start playing an audio file')
+		self.sequenceLoadTime = self.__addHistogram('falcon_sequence_load_seconds', 'time to load a sequence from the library')
+		self.droppedFrames = self.__addCounter('falcon_dropped_frames_total', 'frames skipped because they missed their deadline')
+		self.shows = self.__addCounter('falcon_shows_total', 'shows which were started')
+		
+	def format(self):
+		lines = []
+		for name, description, metric in self._metrics:
+			lines.append('# HELP ' + name + ' ' + description)
+			if isinstance(metric, MetricCounter):
+				lines.append('# TYPE ' + name + ' counter')
+				lines.append(name + ' ' + str(metric.get()))
+				continue
+			
+			# the count is taken from the buckets, so it matches them while frames are added concurrently
+			lines.append('# TYPE ' + name + ' histogram')
+			counts = metric.getCounts().tolist()
+			cumulativeCount = 0
+			for upperBound, count in zip(metric.getUpperBounds(), counts):
+				cumulativeCount += count
+				lines.append(name + '_bucket{le="' + repr(upperBound/1000000000) + '"} ' + str(cumulativeCount))
+			cumulativeCount += counts[-1]
+			lines.append(name + '_bucket{le="+Inf"} ' + str(cumulativeCount))
+			lines.append(name + '_sum ' + repr(metric.getSum()/1000000000))
+			lines.append(name + '_count ' + str(cumulativeCount))
+		return '\n'.join(lines) + '\n'
+		
+	def __addHistogram(self, name, description):
+		histogram = Histogram()
+		self._metrics.append((name, description, histogram))
+		return histogram
+		
+	def __addCounter(self, name, description):
+		counter = MetricCounter()
+		self._metrics.append((name, description, counter))
+		return counter
+		
+class MonotonicClock:
+	def __init__(self):
+		self._start = time.monotonic_ns()
+		
+	def start(self, audioPlayer):
+		self._start = time.monotonic_ns()
+		
+	def now(self):
+		return time.monotonic_ns() - self._start
+		
+	def seek(self, positionInNanoseconds):
+		self._start = time.monotonic_ns() - positionInNanoseconds
+		
+	def logStatistics(self):
+		pass
+		
+class AudioClock:
+	def __init__(self, latencyInMilliseconds, smoothing):
+		self._latency = int(latencyInMilliseconds*1000000)
+		self._smoothing = smoothing
+		self._audioPlayer = None
+		self._start = time.monotonic_ns()
+		self._offset = -self._latency
+		self._last = -self._latency
+		self._maximumCorrection = 0
+		
+	def start(self, audioPlayer):
+		self._audioPlayer = audioPlayer
+		self._start = time.monotonic_ns()
+		self._offset = -self._latency
+		self._last = -self._latency
+		self._maximumCorrection = 0
+		
+	def now(self):
+		elapsed = time.monotonic_ns() - self._start
+		position = self._audioPlayer.getPositionInMilliseconds()
+		
+		# the audio position only advances with each mixer buffer, therefore the
+		# offset to the monotonic clock is smoothed instead of using it directly
+		if position >= 0:
+			correction = position*1000000 - self._latency - elapsed - self._offset
+			self._offset += int(self._smoothing*correction)
+			self._maximumCorrection = max(self._maximumCorrection, abs(correction))
+		
+		self._last = max(self._last, elapsed + self._offset)
+		return self._last
+		
+	def seek(self, positionInNanoseconds):
+		# the audio was moved to the position, so the clock may go backwards this once
+		self._start = time.monotonic_ns() - positionInNanoseconds
+		self._offset = -self._latency
+		self._last = positionInNanoseconds - self._latency
+		
+	def logStatistics(self):
+		logger.info('audio clock offset ' + '{:.1f}'.format(self._offset/1000000) + 'ms, maximum correction ' + '{:.1f}'.format(self._maximumCorrection/1000000) + 'ms')
+		
+class FrameScheduler:
+	DROP = 'drop'
+	LATEST = 'latest'
+	STRETCH = 'stretch'
+	policies = [DROP, LATEST, STRETCH]
+	
+	def __init__(self, frameCount, frameLengthInMilliseconds, policy, trace, wait, clock, metrics):
+		if policy not in self.policies:
+			raise ValueError('the frame policy must be one of ' + ', '.join(self.policies))
+		self._frameCount = frameCount
+		self._frameLength = int(frameLengthInMilliseconds*1000000)
+		self._policy = policy
+		self._trace = trace
+		self._wait = wait
+		self._clock = clock
+		self._metrics = metrics
+		self._nextFrame = 0
+		self._renderedFrameCount = 0
+		self._droppedFrameCount = 0
+		self._stretch = 0
+		self._shift = 0
+		
+	def waitForNextFrame(self):
+		frame = self._nextFrame
+		if frame >= self._frameCount:
+			self.__waitForEnd()
+			return None
+		
+		now = self._clock.now()
+		if now < self.__getDeadline(frame):
+			self._trace.record(TraceBuffer.WAIT, self.__getDeadline(frame) - now)
+			if not self.__waitUntil(self.__getDeadline(frame)):
+				return None
+			now = self._clock.now()
+		elif now - self.__getDeadline(frame) >= self._frameLength and self._policy != self.STRETCH:
+			frame = self.__skipLateFrames(frame, now)
+			self._nextFrame = frame
+			if frame >= self._frameCount:
+				self.__waitForEnd()
+				return None
+			if self._policy == self.DROP:
+				if not self.__waitUntil(self.__getDeadline(frame)):
+					return None
+			now = self._clock.now()
+		elif not self._wait(0):
+			return None
+		
+		lateness = max(now - self.__getDeadline(frame), 0)
+		self._renderedFrameCount += 1
+		self._metrics.lateness.add(lateness)
+		
+		if self._policy == self.STRETCH and lateness >= self._frameLength:
+			# the remaining frames are shifted, so no frame is skipped
+			self._stretch += lateness
+			self._trace.record(TraceBuffer.STRETCHED, lateness)
+		
+		self._nextFrame = frame + 1
+		return frame
+		
+	def seek(self, positionInNanoseconds):
+		# the following frames are shifted so that the frame at the position is due right now
+		frame = max(positionInNanoseconds, 0)//self._frameLength
+		self._shift = self._clock.now() - self._stretch - frame*self._frameLength
+		self._nextFrame = frame + 1
+		if frame >= self._frameCount:
+			return None
+		return frame
+		
+	def getFrameCount(self):
+		return self._frameCount
+		
+	def getNextFrame(self):
+		return self._nextFrame
+		
+	def getRenderedFrameCount(self):
+		return self._renderedFrameCount
+		
+	def getDroppedFrameCount(self):
+		return self._droppedFrameCount
+		
+	def getStretchInNanoseconds(self):
+		return self._stretch
+		
+	def logStatistics(self):
+		logger.info('rendered ' + str(self.getRenderedFrameCount()) + ' of ' + str(self._frameCount) + ' frames with policy ' + self._policy + ', dropped ' + str(self._droppedFrameCount) + ', stretched by ' + '{:.3f}'.format(self._stretch/1000000000) + 's')
+		logger.info('frame lateness over all shows: ' + self._metrics.lateness.describe())
+		
+	def __getDeadline(self, frame):
+		return self._shift + self._stretch + frame*self._frameLength
+		
+	def __waitForEnd(self):
+		# the last frame is shown for its whole length before the show ends
+		self.__waitUntil(self.__getDeadline(self._frameCount))
+		
+	def __waitUntil(self, deadline):
+		# the wait returns early on events and tells whether the playback should go on
+		now = self._clock.now()
+		while now < deadline:
+			if not self._wait((deadline - now)/1000000000):
+				return False
+			now = self._clock.now()
+		return True
+		
+	def __skipLateFrames(self, frame, now):
+		currentFrame = (now - self._shift - self._stretch)//self._frameLength
+		if self._policy == self.DROP:
+			# late frames are not shown at all, the next frame is shown at its deadline
+			nextFrame = currentFrame + 1
+			self._droppedFrameCount += min(nextFrame, self._frameCount) - frame
+			self._metrics.droppedFrames.increment(min(nextFrame, self._frameCount) - frame)
+			self._trace.record(TraceBuffer.DROPPED, nextFrame - frame)
+			if nextFrame < self._frameCount:
+				self._trace.record(TraceBuffer.WAIT, self.__getDeadline(nextFrame) - now)
+			return nextFrame
+		
+		# the frame which is due right now is shown immediately
+		self._droppedFrameCount += min(currentFrame, self._frameCount) - frame
+		self._metrics.droppedFrames.increment(min(currentFrame, self._frameCount) - frame)
+		self._trace.record(TraceBuffer.DROPPED, currentFrame - frame)
+		return currentFrame
+		
+class HardwareBackend:
+	def __init__(self):
+		# the hardware libraries are only available on the raspberry pi
+		import gpiozero
+		import pygame
+		import neopixel
+		self._gpiozero = gpiozero
+		self._pygame = pygame
+		self._neopixel = neopixel
+		
+	def createSwitch(self, pin):
+		return self._gpiozero.LED(pin)
+		
+	def createPwmOutput(self, pin):
+		return self._gpiozero.PWMLED(pin)
+		
+	def createButton(self, pin):
+		return self._gpiozero.Button(pin)
+		
+	def createLedStrip(self, channels, frequency, dma):
+		return self._neopixel.Adafruit_NeoPixel_MultiChannel(channels, frequency, dma)
+		
+	def createAudioOutput(self):
+		self._pygame.mixer.init()
+		return self._pygame.mixer.music
+		
+	def createSound(self, fileName):
+		return self._pygame.mixer.Sound(fileName)
+		
+	def getAudioFormat(self):
+		frequency, sampleFormat, channels = self._pygame.mixer.get_init()
+		return frequency, abs(sampleFormat)//8, channels
+		
+	def getAudioError(self):
+		return self._pygame.error
+		
+class SimulatedBackend:
+	def __init__(self, latencyInSeconds):
+		self._latency = latencyInSeconds
+		
+	def createSwitch(self, pin):
+		return SimulatedOutput(self._latency)
+		
+	def createPwmOutput(self, pin):
+		return SimulatedOutput(self._latency)
+		
+	def createButton(self, pin):
+		return SimulatedButton()
+		
+	def createLedStrip(self, channels, frequency, dma):
+		return SimulatedLedStrip([0 if x is None else x[0] for x in channels], self._latency)
+		
+	def createAudioOutput(self):
+		return SimulatedAudioOutput(self._latency)
+		
+	def getAudioError(self):
+		return SimulatedAudioError
+		
+	def createSound(self, fileName):
+		return SimulatedSound(fileName, self._latency)
+		
+	def getAudioFormat(self):
+		return 44100, 2, 2
+		
+def simulateLatency(latency):
+	if latency > 0:
+		time.sleep(latency)
+		
+class SimulatedOutput:
+	def __init__(self, latency):
+		self._latency = latency
+		self._value = 0
+		self.writeCount = 0
+		
+	@property
+	def value(self):
+		return self._value
+		
+	@value.setter
+	def value(self, value):
+		simulateLatency(self._latency)
+		self._value = value
+		self.writeCount += 1
+		
+	def on(self):
+		self.value = 1
+		
+	def off(self):
+		self.value = 0
+		
+class SimulatedButton:
+	is_pressed = False
+	when_pressed = None
+	when_released = None
+	
+	def press(self):
+		self.is_pressed = True
+		if self.when_pressed is not None:
+			self.when_pressed()
+			
+	def release(self):
+		self.is_pressed = False
+		if self.when_released is not None:
+			self.when_released()
+		
+class SimulatedLedStrip:
+	def __init__(self, ledCounts, latency):
+		self._latency = latency
+		self._pixels = [array.array('I', bytes(4*x)) for x in ledCounts]
+		self.renderCount = 0
+		
+	def begin(self):
+		pass
+		
+	def show(self):
+		simulateLatency(self._latency)
+		self.renderCount += 1
+		
+	def setPixelColor(self, channel, n, color):
+		self._pixels[channel][n] = color
+		
+	def setPixels(self, channel, buffer, offset=0):
+		data = memoryview(buffer).cast('B')
+		memoryview(self._pixels[channel]).cast('B')[4*offset:4*offset + len(data)] = data
+		
+	def getPixelBuffer(self, channel):
+		return array.array('I', self._pixels[channel])
+		
+	def numPixels(self, channel):
+		return len(self._pixels[channel])
+		
+	def getPixelColor(self, channel, n):
+		return self._pixels[channel][n]
+		
+class SimulatedAudioError(Exception):
+	pass
+	
+class SimulatedAudioOutput:
+	def __init__(self, latency):
+		self._latency = latency
+		self._start = None
+		self.source = None
+		
+	def load(self, source, nameHint=None):
+		simulateLatency(self._latency)
+		self.source = source
+		
+	def play(self, loops=0, start=0.0):
+		# like the music player the position counts from the start of the playback
+		simulateLatency(self._latency)
+		self._start = time.monotonic()
+		
+	def stop(self):
+		self._start = None
+		
+	def get_pos(self):
+		if self._start is None:
+			return -1
+		return int((time.monotonic() - self._start)*1000)
+		
+class SimulatedSound:
+	def __init__(self, fileName, latency):
+		# decoding the whole file takes much longer than starting it
+		simulateLatency(10*latency)
+		self._latency = latency
+		self._length = 0
+		self._samples = b''
+		if os.path.exists(fileName):
+			with wave.open(fileName) as waveFile:
+				self._length = waveFile.getnframes()/waveFile.getframerate()
+				self._samples = waveFile.readframes(waveFile.getnframes())
+		
+	def play(self):
+		return SimulatedChannel(self._length)
+		
+	def get_length(self):
+		return self._length
+		
+	def get_raw(self):
+		return self._samples
+		
+class SimulatedChannel:
+	def __init__(self, length):
+		self._end = time.monotonic() + length
+		
+	def get_busy(self):
+		return time.monotonic() < self._end
+		
+	def stop(self):
+		self._end = 0
+		
+class AudioCue:
+	# a short cue which is decoded once and played from memory on a mixer channel
+	def __init__(self, sound, audioFormat):
+		frequency, sampleWidth, channels = audioFormat
+		self._sound = sound
+		self._audioFormat = audioFormat
+		self._sizeInBytes = int(sound.get_length()*frequency)*sampleWidth*channels
+		self._channel = None
+		self._start = None
+		
+	def play(self):
+		self._channel = self._sound.play()
+		self._start = time.monotonic()
+		
+	def stop(self):
+		if self._channel is not None:
+			self._channel.stop()
+			self._channel = None
+		
+	def getPositionInMilliseconds(self):
+		if self._channel is None or not self._channel.get_busy():
+			return -1
+		return int((time.monotonic() - self._start)*1000)
+		
+	def canSeek(self):
+		# a sound always plays from its beginning on a mixer channel
+		return False
+		
+	def seek(self, positionInMilliseconds):
+		raise ValueError('a cue played on a mixer channel cannot be moved')
+		
+	def getPcm(self):
+		frequency, sampleWidth, channels = self._audioFormat
+		return self._sound.get_raw(), frequency, sampleWidth, channels
+		
+	def getSizeInBytes(self):
+		return self._sizeInBytes
+		
+class BufferedAudioTrack:
+	# a long track is kept encoded in memory and streamed by the music player
+	def __init__(self, fileName, output, audioError):
+		with open(fileName, 'rb') as audioFile:
+			self._data = audioFile.read()
+		self._nameHint = os.path.splitext(fileName)[1][1:]
+		self._output = output
+		self._audioError = audioError
+		self._offset = 0
+		
+	def play(self):
+		self._output.load(io.BytesIO(self._data), self._nameHint)
+		self._output.play()
+		self._offset = 0
+		
+	def stop(self):
+		self._output.stop()
+		
+	def getPositionInMilliseconds(self):
+		# the music player counts from where it was last started
+		position = self._output.get_pos()
+		if position < 0:
+			return -1
+		return position + self._offset
+		
+	def canSeek(self):
+		return True
+		
+	def seek(self, positionInMilliseconds):
+		# the music player cannot start every format at an offset, those are restarted from the beginning
+		try:
+			self._output.play(start=positionInMilliseconds/1000)
+		except self._audioError as error:
+			logger.warning('cannot move the ' + self._nameHint + ' playback to ' + str(positionInMilliseconds) + 'ms, restarting it from the beginning: ' + str(error))
+			self._output.play()
+			self._offset = 0
+			return 0
+		self._offset = int(positionInMilliseconds)
+		return self._offset
+		
+	def getPcm(self):
+		# only uncompressed tracks can be analyzed, they are decoded when needed
+		try:
+			with wave.open(io.BytesIO(self._data)) as waveFile:
+				return waveFile.readframes(waveFile.getnframes()), waveFile.getframerate(), waveFile.getsampwidth(), waveFile.getnchannels()
+		except (wave.Error, EOFError):
+			return None
+		
+	def getSizeInBytes(self):
+		return len(self._data)
+		
+class AudioCueCache:
+	def __init__(self, backend, output, maximumSizeInBytes, streamThresholdInBytes):
+		self._backend = backend
+		self._output = output
+		self._maximumSize = maximumSizeInBytes
+		self._streamThreshold = streamThresholdInBytes
+		self._cues = OrderedDict()
+		self._size = 0
+		self._hitCount = 0
+		self._missCount = 0
+		self._evictionCount = 0
+		# the cues are preloaded on other threads while the main loop plays them, the files
+		# are decoded outside of the lock, so a cached cue is not held up by a slow load
+		self._lock = threading.Lock()
+		
+	def preload(self, fileNames):
+		for fileName in fileNames:
+			with self._lock:
+				if fileName in self._cues:
+					continue
+			self.__insert(fileName, self.__load(fileName))
+		
+	def get(self, fileName):
+		with self._lock:
+			cue = self._cues.get(fileName)
+			if cue is not None:
+				self._hitCount += 1
+				self._cues.move_to_end(fileName)
+				return cue
+			self._missCount += 1
+		return self.__insert(fileName, self.__load(fileName))
+		
+	def getSizeInBytes(self):
+		with self._lock:
+			return self._size
+		
+	def logStatistics(self):
+		with self._lock:
+			logger.info('audio cache holds ' + str(len(self._cues)) + ' cues in ' + str(self._size//1024) + 'kB, ' + str(self._hitCount) + ' hits, ' + str(self._missCount) + ' misses, ' + str(self._evictionCount) + ' evictions')
+		
+	def __load(self, fileName):
+		start = time.time()
+		try:
+			size = os.path.getsize(fileName)
+		except OSError:
+			# the backend decides what a missing file means, the simulation plays silence
+			size = 0
+		if size > self._streamThreshold:
+			cue = BufferedAudioTrack(fileName, self._output, self._backend.getAudioError())
+		else:
+			sound = self._backend.createSound(fileName)
+			cue = AudioCue(sound, self._backend.getAudioFormat())
+		logger.info('loaded ' + fileName + ' with ' + str(cue.getSizeInBytes()//1024) + 'kB in ' + '{:.3f}'.format(time.time() - start) + 's')
+		return cue
+		
+	def __insert(self, fileName, cue):
+		with self._lock:
+			# another thread may have loaded the same file in the meantime
+			if fileName in self._cues:
+				self._cues.move_to_end(fileName)
+				return self._cues[fileName]
+			self._cues[fileName] = cue
+			self._size += cue.getSizeInBytes()
+			self.__evict()
+			return cue
+		
+	def __evict(self):
+		# the cue which was loaded last is kept even if it exceeds the limit on its own
+		while self._size > self._maximumSize and len(self._cues) > 1:
+			fileName, cue = self._cues.popitem(last=False)
+			self._size -= cue.getSizeInBytes()
+			self._evictionCount += 1
+			logger.info('evicted ' + fileName + ' from the audio cache')
+		
+class AudioPlayer:
+	def __init__(self, backend, maximumCacheSizeInBytes, streamThresholdInBytes, metrics):
 		logger.info("initializing audio player")
-		pygame.mixer.init()
+		self._metrics = metrics
+		self._output = backend.createAudioOutput()
+		self._cache = AudioCueCache(backend, self._output, maximumCacheSizeInBytes, streamThresholdInBytes)
+		self._cue = None
 		
 	def __enter__(self):
 		return self
@@ -53,28 +914,102 @@ class AudioPlayer:
 		logger.info("destroying audio player")
 		self.stop()
 		
+	def preload(self, audioFiles):
+		self._cache.preload(audioFiles)
+		
 	def play(self, audioFile):
 		logger.info("starting to play " + audioFile)
-		pygame.mixer.music.load(audioFile)
-		pygame.mixer.music.play()
+		start = time.monotonic_ns()
+		cue = self._cache.get(audioFile)
+		if self._cue is not None:
+			self._cue.stop()
+		self._cue = cue
+		cue.play()
+		latency = time.monotonic_ns() - start
+		self._metrics.audioStartLatency.add(latency)
+		logger.debug('started ' + audioFile + ' after ' + '{:.2f}'.format(latency/1000000) + 'ms')
 		
 	def stop(self):
 		logger.info("stopping audio playback")
-		pygame.mixer.music.stop()
+		if self._cue is not None:
+			self._cue.stop()
+			self._cue = None
+		else:
+			self._output.stop()
+		
+	def getPositionInMilliseconds(self):
+		if self._cue is None:
+			return -1
+		return self._cue.getPositionInMilliseconds()
+		
+	def canSeek(self):
+		return self._cue is not None and self._cue.canSeek()
+		
+	def seek(self, positionInMilliseconds):
+		logger.info('moving the audio playback to ' + str(positionInMilliseconds) + 'ms')
+		return self._cue.seek(positionInMilliseconds)
+		
+	def getPcm(self):
+		if self._cue is None:
+			return None
+		return self._cue.getPcm()
+		
+	def logStatistics(self):
+		self._cache.logStatistics()
+		logger.info('audio start latency over all shows: ' + self._metrics.audioStartLatency.describe())
+		
+class OutputCache:
+	def __init__(self):
+		self._values = {}
+		self._writeCount = 0
+		self._skippedWriteCount = 0
+		
+	def hasChanged(self, output, value):
+		if output in self._values and self._values[output] == value:
+			self._skippedWriteCount += 1
+			return False
+		
+		self._values[output] = value
+		self._writeCount += 1
+		return True
+		
+	def getWriteCount(self):
+		return self._writeCount
+		
+	def getSkippedWriteCount(self):
+		return self._skippedWriteCount
 		
 class LedStrip:
-	_ledCount = 39
-	_ledPin = 18
+	# the pins of the two pwm channels of the controller
+	_ledPins = (18, 13)
 	_ledFrequency = 800000
 	_ledDma = 10
 	_ledInvert = False
 	_ledBrightness = 255
-	_ledChannel = 0
 	
-	def __init__(self):
-		logger.info("initializing led strip")
-		self._ledStrip = Adafruit_NeoPixel(self._ledCount, self._ledPin, self._ledFrequency, self._ledDma, self._ledInvert, self._ledBrightness, self._ledChannel)
+	def __init__(self, backend, segments):
+		# the logical strip is made of segments, each a number of leds on a channel;
+		# segments on the same channel follow each other on the physical strip
+		self._ledCount = sum([x[1] for x in segments])
+		logger.info("initializing led strip with " + str(self._ledCount) + " leds in " + str(len(segments)) + " segments")
+		self._segments = []
+		channelCounts = [0, 0]
+		for channel, count in segments:
+			if channel not in (0, 1):
+				raise ValueError('the channel of a segment must be 0 or 1')
+			self._segments.append((sum([x[1] for x in self._segments]), count, channel, channelCounts[channel]))
+			channelCounts[channel] += count
+		self._segmentStarts = [x[0] for x in self._segments]
+		
+		channels = [(channelCounts[i], self._ledPins[i], self._ledInvert, self._ledBrightness) if channelCounts[i] > 0 else None for i in range(2)]
+		self._ledStrip = backend.createLedStrip(channels, self._ledFrequency, self._ledDma)
 		self._ledStrip.begin()
+		self._pixels = array.array('I', bytes(4*self._ledCount))
+		self._pixelView = memoryview(self._pixels)
+		self._renderCount = 0
+		self._pixelWriteCount = 0
+		self._skippedRenderCount = 0
+		self._skippedPixelCount = 0
 		
 	def __enter__(self):
 		return self
@@ -85,40 +1020,110 @@ class LedStrip:
 		
 	def turnOff(self):
 		logger.info("turning all pixel off")
-		for i in range(self._ledCount):
-			self._ledStrip.setPixelColor(i, Color(0, 0, 0))
-		self._ledStrip.show()
+		self._pixels[:] = array.array('I', bytes(4*self._ledCount))
+		self.__render()
 		
 	def setPixelColor(self, pixel, color):
-		logger.info("setting color for pixel " + str(pixel))
 		if pixel < 0 or pixel >= self._ledCount:
 			raise ValueError('the pixel index must be within 0 and ' + str(self._ledCount))
-		self._ledStrip.setPixelColor(pixel, color)
+		if self._pixels[pixel] == color:
+			self._skippedPixelCount += 1
+			self._skippedRenderCount += 1
+			return
+		self._pixels[pixel] = color
+		start, count, channel, offset = self._segments[bisect.bisect_right(self._segmentStarts, pixel) - 1]
+		self._ledStrip.setPixelColor(channel, offset + pixel - start, color)
+		self._pixelWriteCount += 1
 		self._ledStrip.show()
+		self._renderCount += 1
 		
-	def setMultiplePixelColor(self, pixels, colors):
-		logger.info("setting color for multiple pixels")
+	def setAllPixelColors(self, colors):
+		if len(colors) != self._ledCount:
+			raise ValueError('there must be a color for each of the ' + str(self._ledCount) + ' pixels')
+		if self._pixelView == colors:
+			self._skippedPixelCount += self._ledCount
+			self._skippedRenderCount += 1
+			return
+		self._pixelView[:] = colors
+		self._pixelWriteCount += self._ledCount
+		self.__render()
 		
-		for i in range(len(pixels)):
-			pixel = pixels[i]
-			color = colors[i]
-			if pixel < 0 or pixel >= self._ledCount:
-				raise ValueError('the pixel index must be within 0 and ' + str(self._ledCount))
-			self._ledStrip.setPixelColor(pixel, color)
-			
+	def getLedCount(self):
+		return self._ledCount
+		
+	def getRenderCount(self):
+		return self._renderCount
+		
+	def getPixelWriteCount(self):
+		return self._pixelWriteCount
+		
+	def getSkippedRenderCount(self):
+		return self._skippedRenderCount
+		
+	def getSkippedPixelCount(self):
+		return self._skippedPixelCount
+		
+	def __render(self):
+		# every segment is copied into its channel, then both channels are sent at once
+		for start, count, channel, offset in self._segments:
+			self._ledStrip.setPixels(channel, self._pixelView[start:start + count], offset)
 		self._ledStrip.show()
+		self._renderCount += 1
 
-class Peripherals:
-	_mainSwitch = LED(17)
-	_cockpit = PWMLED(27)
-	_turret = PWMLED(22)
-	_front = PWMLED(4)
-	_landingGearAndRamp = PWMLED(25)
-	_drive = LedStrip()
-	_start = Button(23)
+class OutputCharacteristics:
+	TURRET = 0
+	COCKPIT = 1
+	FRONT = 2
+	LANDING_GEAR_AND_RAMP = 3
+	_blueByte, _redByte, _greenByte = (0, 1, 2) if sys.byteorder == 'little' else (3, 2, 1)
 	
-	def __init__(self):
+	def __init__(self, pwmNonlinearBases, driveGammas):
+		logger.info('building output characteristic tables')
+		self._pwmTables = [self.__createPwmTable(x) for x in pwmNonlinearBases]
+		self._redTable, self._greenTable, self._blueTable = [self.__createColorTable(x) for x in driveGammas]
+		
+	def getDutyCycle(self, channel, value):
+		if value < 0 or value > 1:
+			raise ValueError('the value for an output must be within the range 0 and 1')
+		return self._pwmTables[channel][int(round(value*255))]
+		
+	def getDutyCycles(self, values):
+		return tuple([self._pwmTables[i][values[i]] for i in range(len(self._pwmTables))])
+		
+	def correctDrive(self, drive):
+		red = bytes(drive[0::3]).translate(self._redTable)
+		green = bytes(drive[1::3]).translate(self._greenTable)
+		blue = bytes(drive[2::3]).translate(self._blueTable)
+		return red, green, blue
+		
+	def packDrive(self, drive, words):
+		# the drive is wired in GRB order, therefore the words are packed as 0x00GGRRBB
+		red, green, blue = self.correctDrive(drive)
+		words[self._blueByte::4] = blue
+		words[self._redByte::4] = red
+		words[self._greenByte::4] = green
+		
+	def __createPwmTable(self, nonlinearBase):
+		# the outputs are active low, a brightness of 1 results in the smallest duty cycle
+		return tuple([(nonlinearBase**(1 - x/255))/nonlinearBase for x in range(256)])
+		
+	def __createColorTable(self, gamma):
+		return bytes([int(round(255*(x/255)**gamma)) for x in range(256)])
+		
+class Peripherals:
+	def __init__(self, backend, events, characteristics, driveSegments):
 		logger.info("initializing peripherals")
+		self._characteristics = characteristics
+		self._mainSwitch = backend.createSwitch(17)
+		self._cockpit = backend.createPwmOutput(27)
+		self._turret = backend.createPwmOutput(22)
+		self._front = backend.createPwmOutput(4)
+		self._landingGearAndRamp = backend.createPwmOutput(25)
+		self._drive = LedStrip(backend, driveSegments)
+		self._start = backend.createButton(23)
+		self._outputCache = OutputCache()
+		self._start.when_pressed = lambda: events.put(EventQueue.START_PRESSED)
+		self._start.when_released = lambda: events.put(EventQueue.START_RELEASED)
 		self.setAll(0)
 		self.turnOn()
 		
@@ -131,36 +1136,31 @@ class Peripherals:
 		self.turnOff()
 		self._drive.__exit__(exc_type, exc_value, traceback)
 	
-	def compensateOutputCharacteristics(self, value):
-		logger.debug('compensating output characteristic for value ' + '{:.2f}'.format(value))
-		if value < 0 or value > 1:
-			raise ValueError('the value for an output must be within the range 0 and 1')
-		
-		value = 1 - value
-		nonlinearBase = 100
-		value = (nonlinearBase**value)/(nonlinearBase**1)
-		logger.debug('compensated value is ' + '{:.2f}'.format(value))
-		return value
-		
 	def setCockpit(self, value):
-		logger.debug('setting value ' + '{:.2f}'.format(value) + ' for cockpit')
-		compensatedValue = self.compensateOutputCharacteristics(value)
-		self._cockpit.value = compensatedValue
+		logger.debug('setting value %.2f for cockpit', value)
+		compensatedValue = self._characteristics.getDutyCycle(OutputCharacteristics.COCKPIT, value)
+		self.__setDutyCycle(self._cockpit, compensatedValue)
 		
 	def setTurret(self, value):
-		logger.debug('setting value ' + '{:.2f}'.format(value) + ' for turret')
-		compensatedValue = self.compensateOutputCharacteristics(value)
-		self._turret.value = compensatedValue
+		logger.debug('setting value %.2f for turret', value)
+		compensatedValue = self._characteristics.getDutyCycle(OutputCharacteristics.TURRET, value)
+		self.__setDutyCycle(self._turret, compensatedValue)
 		
 	def setFront(self, value):
-		logger.debug('setting value ' + '{:.2f}'.format(value) + ' for front')
-		compensatedValue = self.compensateOutputCharacteristics(value)
-		self._front.value = compensatedValue
+		logger.debug('setting value %.2f for front', value)
+		compensatedValue = self._characteristics.getDutyCycle(OutputCharacteristics.FRONT, value)
+		self.__setDutyCycle(self._front, compensatedValue)
 		
 	def setLandingGearAndRamp(self, value):
-		logger.debug('setting value ' + '{:.2f}'.format(value) + ' for landing gear and ramp')
-		compensatedValue = self.compensateOutputCharacteristics(value)
-		self._landingGearAndRamp.value = compensatedValue
+		logger.debug('setting value %.2f for landing gear and ramp', value)
+		compensatedValue = self._characteristics.getDutyCycle(OutputCharacteristics.LANDING_GEAR_AND_RAMP, value)
+		self.__setDutyCycle(self._landingGearAndRamp, compensatedValue)
+		
+	def setDutyCycles(self, turret, cockpit, front, landingGearAndRamp):
+		self.__setDutyCycle(self._turret, turret)
+		self.__setDutyCycle(self._cockpit, cockpit)
+		self.__setDutyCycle(self._front, front)
+		self.__setDutyCycle(self._landingGearAndRamp, landingGearAndRamp)
 		
 	def setAll(self, value):
 		self.setCockpit(value)
@@ -179,182 +1179,1728 @@ class Peripherals:
 	def setDrive(self, pixel, color):
 		self._drive.setPixelColor(pixel, color)
 		
-	def setCompleteDrive(self, pixels, colors):
-		self._drive.setMultiplePixelColor(pixels, colors)
+	def setCompleteDrive(self, colors):
+		self._drive.setAllPixelColors(colors)
+		
+	def setFrame(self, dutyCycles, colors):
+		self.setDutyCycles(*dutyCycles)
+		self.setCompleteDrive(colors)
 		
-	def shouldRun(self):
+	def turnOffDrive(self):
+		self._drive.turnOff()
+		
+	def isStartPressed(self):
 		return self._start.is_pressed
 		
+	def getDriveLedCount(self):
+		return self._drive.getLedCount()
+		
+	def logOutputStatistics(self):
+		logger.info('pwm outputs: ' + str(self._outputCache.getWriteCount()) + ' writes, ' + str(self._outputCache.getSkippedWriteCount()) + ' skipped')
+		logger.info('drive: ' + str(self._drive.getRenderCount()) + ' renders, ' + str(self._drive.getSkippedRenderCount()) + ' skipped, ' + str(self._drive.getPixelWriteCount()) + ' pixel writes, ' + str(self._drive.getSkippedPixelCount()) + ' unchanged pixels')
+		
+	def __setDutyCycle(self, output, value):
+		if self._outputCache.hasChanged(output, value):
+			output.value = value
+		
+class Frame:
+	def __init__(self, ledCount):
+		self.dutyCycles = (0, 0, 0, 0)
+		self.colors = array.array('I', bytes(4*ledCount))
+		self.colorView = memoryview(self.colors)
+		self.timestamp = 0
+		
+class FrameBuffer:
+	# triple buffer: the producer fills the back frame and swaps it with the pending
+	# one, the consumer swaps the pending frame with the front frame it renders, so
+	# neither side ever waits for the other and the newest frame always wins
+	def __init__(self, ledCount):
+		self._back = Frame(ledCount)
+		self._pending = Frame(ledCount)
+		self._front = Frame(ledCount)
+		self._condition = threading.Condition()
+		self._fresh = False
+		self._closed = False
+		self._publishedCount = 0
+		self._replacedCount = 0
+		
+	def getBackFrame(self):
+		return self._back
+		
+	def publish(self):
+		with self._condition:
+			self._back, self._pending = self._pending, self._back
+			if self._fresh:
+				self._replacedCount += 1
+			self._fresh = True
+			self._publishedCount += 1
+			self._condition.notify()
+		
+	def take(self):
+		with self._condition:
+			while not self._fresh and not self._closed:
+				self._condition.wait()
+			if not self._fresh:
+				return None
+			self._front, self._pending = self._pending, self._front
+			self._fresh = False
+			return self._front
+		
+	def close(self):
+		with self._condition:
+			self._closed = True
+			self._condition.notify()
+		
+	def getPublishedCount(self):
+		return self._publishedCount
+		
+	def getReplacedCount(self):
+		return self._replacedCount
+		
+class RenderPipeline:
+	def __init__(self, peripherals, ledCount, threaded, frameListener, metrics):
+		self._peripherals = peripherals
+		self._metrics = metrics
+		self._threaded = threaded
+		self._frameListener = frameListener
+		self._frames = FrameBuffer(ledCount)
+		self._renderedFrameCount = 0
+		self._thread = None
+		self._error = None
+		
+	def start(self):
+		if self._threaded:
+			self._thread = threading.Thread(target=self.__run, name='render', daemon=True)
+			self._thread.start()
+		
+	def stop(self):
+		# all frames which were published before are rendered when this returns
+		if self._thread is not None:
+			self._frames.close()
+			self._thread.join()
+			self._thread = None
+		self.checkForErrors()
+		
+	def checkForErrors(self):
+		if self._error is not None:
+			raise self._error
+		
+	def setFrame(self, dutyCycles, colors, timestamp=None):
+		# the timestamp tells when the frame was started, by default when it is published
+		if timestamp is None:
+			timestamp = time.monotonic_ns()
+		
+		if not self._threaded:
+			self.__render(dutyCycles, colors, timestamp)
+			return
+		
+		# a failed render thread ends the show instead of silently dropping its frames
+		self.checkForErrors()
+		frame = self._frames.getBackFrame()
+		frame.dutyCycles = dutyCycles
+		frame.colorView[:] = colors
+		frame.timestamp = timestamp
+		self._frames.publish()
+		
+	def logStatistics(self):
+		logger.info('render pipeline: ' + str(self._renderedFrameCount) + ' frames rendered, ' + str(self._frames.getReplacedCount()) + ' replaced by a newer frame before rendering')
+		logger.info('render time over all shows: ' + self._metrics.renderTime.describe())
+		logger.info('frame latency until rendered over all shows: ' + self._metrics.renderLatency.describe())
+		
+	def __run(self):
+		try:
+			while True:
+				frame = self._frames.take()
+				if frame is None:
+					return
+				self.__render(frame.dutyCycles, frame.colors, frame.timestamp)
+		except Exception as e:
+			logger.exception('render thread failed')
+			self._error = e
+		
+	def __render(self, dutyCycles, colors, timestamp):
+		start = time.monotonic_ns()
+		self._peripherals.setFrame(dutyCycles, colors)
+		end = time.monotonic_ns()
+		self._renderedFrameCount += 1
+		self._metrics.renderTime.add(end - start)
+		self._metrics.renderLatency.add(end - timestamp)
+		self._frameListener(dutyCycles, colors)
+		
+class AudioReactiveDrive:
+	# the drive follows the band energies of the audio which is currently played instead
+	# of the sequence, the pwm outputs still follow the sequence
+	_windowLength = 2048
+	_lowestFrequency = 40
+	_highestFrequency = 16000
+	_dynamicRangeInDecibels = 60
+	_peakDecayInDecibels = 0.05
+	_release = 0.8
+	_color = (255, 255, 255)
+	
+	def __init__(self, audioPlayer, renderPipeline, characteristics, ledCount, frameRate, bandCount, metrics):
+		# numpy is only needed for this mode
+		import numpy
+		self._numpy = numpy
+		self._audioPlayer = audioPlayer
+		self._renderPipeline = renderPipeline
+		self._characteristics = characteristics
+		self._ledCount = ledCount
+		self._frameLength = int(1000000000/frameRate)
+		self._bandCount = bandCount
+		self._dutyCycles = (0, 0, 0, 0)
+		self._pixels = array.array('I', bytes(4*ledCount))
+		self._pixelBytes = memoryview(self._pixels).cast('B')
+		self._metrics = metrics
+		self._frameCount = 0
+		self._lateFrameCount = 0
+		self._stopped = threading.Event()
+		self._thread = None
+		
+	def start(self):
+		self._stopped.clear()
+		self._thread = threading.Thread(target=self.__run, name='audio-analysis', daemon=True)
+		self._thread.start()
+		
+	def stop(self):
+		if self._thread is not None:
+			self._stopped.set()
+			self._thread.join()
+			self._thread = None
+		
+	def setFrame(self, dutyCycles, colors):
+		# the colors of the sequence are replaced by the analysis
+		self._renderPipeline.checkForErrors()
+		self._dutyCycles = dutyCycles
+		
+	def logStatistics(self):
+		logger.info('audio analysis: ' + str(self._frameCount) + ' frames at ' + '{:.1f}'.format(1000000000/self._frameLength) + 'fps, ' + str(self._lateFrameCount) + ' late')
+		logger.info('audio analysis time over all shows: ' + self._metrics.audioAnalysisTime.describe())
+		
+	def __run(self):
+		# a failure only darkens the drive, the show goes on
+		try:
+			self.__analyze()
+		except Exception:
+			logger.exception('audio analysis failed, the drive stays dark')
+		
+	def __analyze(self):
+		numpy = self._numpy
+		pcm = self._audioPlayer.getPcm()
+		if pcm is None:
+			logger.warning('the audio which is played can not be analyzed, the drive stays dark')
+			return
+		
+		data, frequency, sampleWidth, channels = pcm
+		if sampleWidth not in (1, 2, 3, 4):
+			logger.error('the audio with ' + str(8*sampleWidth) + ' bit samples can not be analyzed, the drive stays dark')
+			return
+		samples = self.__getSamples(data, sampleWidth)
+		samples = samples[:len(samples) - len(samples)%channels].reshape(-1, channels)
+		window = numpy.hanning(self._windowLength)
+		bandEdges = self.__getBandEdges(frequency)
+		ledPositions = numpy.linspace(0, self._bandCount - 1, self._ledCount)
+		bands = numpy.arange(self._bandCount)
+		color = numpy.array(self._color, dtype=numpy.float64)
+		peak = -numpy.inf
+		levels = numpy.zeros(self._bandCount)
+		
+		deadline = time.monotonic_ns()
+		while not self._stopped.is_set():
+			start = time.monotonic_ns()
+			position = self._audioPlayer.getPositionInMilliseconds()
+			values = numpy.zeros(self._bandCount)
+			
+			if position >= 0:
+				# the window ends at the sample which is played right now
+				end = min(position*frequency//1000, len(samples))
+				block = numpy.zeros(self._windowLength)
+				if end > 0:
+					part = samples[max(end - self._windowLength, 0):end].mean(axis=1)
+					block[self._windowLength - len(part):] = part - part.mean()
+				
+				spectrum = numpy.abs(numpy.fft.rfft(block*window))**2
+				energies = numpy.add.reduceat(spectrum[:bandEdges[-1]], bandEdges[:-1])
+				decibels = 10*numpy.log10(energies + 1e-12)
+				
+				# the bands are scaled to the recent peak, so any soundtrack uses the full range
+				peak = max(decibels.max(), peak - self._peakDecayInDecibels)
+				values = numpy.clip(1 - (peak - decibels)/self._dynamicRangeInDecibels, 0, 1)
+			
+			levels = numpy.maximum(values, levels*self._release)
+			drive = numpy.interp(ledPositions, bands, levels)[:, None]*color
+			self._characteristics.packDrive(drive.astype(numpy.uint8).tobytes(), self._pixelBytes)
+			self._renderPipeline.setFrame(self._dutyCycles, self._pixels, start)
+			self._frameCount += 1
+			self._metrics.audioAnalysisTime.add(time.monotonic_ns() - start)
+			
+			deadline += self._frameLength
+			now = time.monotonic_ns()
+			if now > deadline:
+				self._lateFrameCount += 1
+				deadline = now
+			self._stopped.wait((deadline - now)/1000000000)
+		
+	def __getSamples(self, data, sampleWidth):
+		numpy = self._numpy
+		if sampleWidth != 3:
+			return numpy.frombuffer(data, dtype={1: numpy.uint8, 2: numpy.int16, 4: numpy.int32}[sampleWidth])
+		
+		# numpy has no 24 bit type, the little endian samples are padded with a low zero byte to int32
+		samples = numpy.frombuffer(data[:len(data) - len(data)%3], dtype=numpy.uint8).reshape(-1, 3)
+		padded = numpy.zeros((len(samples), 4), dtype=numpy.uint8)
+		padded[:, 1:] = samples
+		return padded.reshape(-1).view('<i4')
+		
+	def __getBandEdges(self, frequency):
+		numpy = self._numpy
+		binCount = self._windowLength//2 + 1
+		highestFrequency = min(self._highestFrequency, frequency/2)
+		frequencies = numpy.geomspace(self._lowestFrequency, highestFrequency, self._bandCount + 1)
+		edges = numpy.clip(numpy.round(frequencies*self._windowLength/frequency).astype(numpy.int64), 1, binCount)
+		
+		# the lowest bands are narrower than a bin, each band gets at least one bin
+		for i in range(1, len(edges)):
+			edges[i] = max(edges[i], edges[i - 1] + 1)
+		if edges[-1] > binCount:
+			raise ValueError('the audio with ' + str(frequency) + 'Hz can not be split into ' + str(self._bandCount) + ' bands')
+		return edges
+		
 class SequenceStep:
-	_turret = 0
-	_cockpit = 0
-	_front = 0
-	_landingGearAndRamp = 0
-	_drive = []
-	
-	def __init__(self, values):
-		self._turret = float(values[0])/255
-		self._cockpit = float(values[1])/255
-		self._front = float(values[2])/255
-		self._landingGearAndRamp = float(values[3])/255
-		driveLedCount = int((len(values) - 4)/3)
-		self._drive = [None] * driveLedCount
-		
-		for i in range(driveLedCount):
-			self._drive[i] = [values[4 + i*3], values[5 + i*3], values[6 + i*3]]
+	def __init__(self, dutyCycles, colors):
+		self._dutyCycles = dutyCycles
+		self._colors = colors
 	
 	def applyTo(self, peripherals):
-		peripherals.setTurret(self._turret)
-		peripherals.setCockpit(self._cockpit)
-		peripherals.setFront(self._front)
-		peripherals.setLandingGearAndRamp(self._landingGearAndRamp)
-		pixels = range(len(self._drive))
-		colors = [Color(x[1], x[0], x[2]) for x in self._drive]		
-		peripherals.setCompleteDrive(pixels, colors)
+		peripherals.setFrame(self._dutyCycles, self._colors)
+
+class SequenceFile:
+	# header: magic, version, pwm channel count, color channels per led, color order,
+	# drive led count, step length in milliseconds, step count; followed by one
+	# fixed width uint8 frame per step (pwm channels first, then the drive leds)
+	_magic = b'FSEQ'
+	_version = 1
+	_headerFormat = '<4sBBB3sHHI'
+	_pwmChannelCount = 4
+	_colorChannelsPerLed = 3
+	_colorOrder = b'RGB'
 	
-class Sequence:
-	_steps = []
-	_driveLedCount = 0
+	def __init__(self, fileName):
+		logger.info('mapping sequence from ' + fileName)
+		with open(fileName, 'rb') as sequenceFile:
+			self._map = mmap.mmap(sequenceFile.fileno(), 0, access=mmap.ACCESS_READ)
+		
+		headerSize = struct.calcsize(self._headerFormat)
+		if len(self._map) < headerSize:
+			self._map.close()
+			raise ValueError('the sequence file ' + fileName + ' is too short for a header')
+		
+		magic, version, pwmChannelCount, colorChannelsPerLed, colorOrder, driveLedCount, stepLengthInMilliseconds, stepCount = struct.unpack_from(self._headerFormat, self._map)
+		if magic != self._magic or version != self._version:
+			self._map.close()
+			raise ValueError('the file ' + fileName + ' is not a sequence file of version ' + str(self._version))
+		if pwmChannelCount != self._pwmChannelCount or colorChannelsPerLed != self._colorChannelsPerLed or colorOrder != self._colorOrder:
+			self._map.close()
+			raise ValueError('the channel layout of the sequence file ' + fileName + ' is not supported')
+		
+		self._driveLedCount = driveLedCount
+		self._stepLengthInMilliseconds = stepLengthInMilliseconds
+		self._stepCount = stepCount
+		self._frameSize = pwmChannelCount + driveLedCount*colorChannelsPerLed
+		
+		if len(self._map) < headerSize + self._frameSize*stepCount:
+			self._map.close()
+			raise ValueError('the sequence file ' + fileName + ' is truncated')
+		
+		self._frames = memoryview(self._map)[headerSize:headerSize + self._frameSize*stepCount]
+		
+	def __enter__(self):
+		return self
+		
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		
+	def close(self):
+		if self._map is None:
+			return
+		
+		self._frames.release()
+		self._map.close()
+		self._map = None
+		
+	def getFrame(self, step):
+		offset = step*self._frameSize
+		return self._frames[offset:offset + self._frameSize]
+		
+	def getStepCount(self):
+		return self._stepCount
+		
+	def getDriveLedCount(self):
+		return self._driveLedCount
+		
+	def getStepLengthInMilliseconds(self):
+		return self._stepLengthInMilliseconds
+		
+	@classmethod
+	def open(cls, fileName):
+		# the version in the header tells whether the steps are stored compressed
+		with open(fileName, 'rb') as sequenceFile:
+			header = sequenceFile.read(5)
+		if len(header) == 5 and header[:4] == cls._magic and header[4] == CompressedSequenceFile._version:
+			return CompressedSequenceFile(fileName)
+		return cls(fileName)
+		
+	def isCompressed(self):
+		return False
+		
+	@classmethod
+	def compileFromCsv(cls, csvFileName, fileName, stepLengthInMilliseconds):
+		logger.info('compiling sequence ' + csvFileName + ' into ' + fileName)
+		driveLedCount, stepCount, frames = cls.parseCsv(csvFileName)
+		
+		header = struct.pack(cls._headerFormat, cls._magic, cls._version, cls._pwmChannelCount, cls._colorChannelsPerLed, cls._colorOrder, driveLedCount, stepLengthInMilliseconds, stepCount)
+		temporaryFileName = fileName + '.tmp'
+		
+		with open(temporaryFileName, 'wb') as sequenceFile:
+			sequenceFile.write(header)
+			sequenceFile.write(frames)
+		
+		os.replace(temporaryFileName, fileName)
+		logger.info('compiled ' + str(stepCount) + ' steps with ' + str(driveLedCount) + ' drive leds')
+		
+	@classmethod
+	def parseCsv(cls, csvFileName):
+		with open(csvFileName, 'r') as csvFile:
+			header = csvFile.readline()
+			driveLedCount = len(re.findall('drive-red-[0-9]*', header))
+			frameSize = cls._pwmChannelCount + driveLedCount*cls._colorChannelsPerLed
+			frames = bytearray()
+			stepCount = 0
+			
+			for line in csvFile:
+				values = re.findall('[0-9]+', line)
+				if len(values) == 0:
+					continue
+				if len(values) != frameSize:
+					raise ValueError('step ' + str(stepCount) + ' in ' + csvFileName + ' has ' + str(len(values)) + ' values instead of ' + str(frameSize))
+				frames += bytes(map(int, values))
+				stepCount += 1
+		
+		return driveLedCount, stepCount, frames
+	
+class CompressedSequenceFile:
+	# header: like version 1 plus the number of steps per block; followed by the byte
+	# offset of each block within the data and the data. Each step is stored as tokens
+	# against the step before it: a token below 0x80 skips that many unchanged channels
+	# plus one, any other token is followed by the new values of its low seven bits plus
+	# one channels. The first step of a block is stored against a dark frame, so seeking
+	# only decodes from the start of the block of the step.
+	_magic = b'FSEQ'
+	_version = 2
+	_headerFormat = '<4sBBB3sHHIH'
+	_pwmChannelCount = 4
+	_colorChannelsPerLed = 3
+	_colorOrder = b'RGB'
+	_stepsPerBlock = 64
+	_maximumRun = 0x80
 	
 	def __init__(self, fileName):
-		logger.info('loading sequence from ' + fileName)
-		sequenceFile = open(fileName, 'r')
-		header = sequenceFile.readline()
-		driveOccurences = re.findall('drive-red-[0-9]*', header)
-		self._driveLedCount = len(driveOccurences)
-		lines = sequenceFile.readlines()
-		lines = [x.strip() for x in lines]
-		iterationSteps = len(lines)
-		self._steps = [None] * iterationSteps
-		
-		for i in range(iterationSteps):
-			logger.info('parsing iteration step ' + str(i) + ' of ' + str(iterationSteps))
-			values = re.findall('[0-9]+', lines[i])
-			values = [int(x) for x in values]
-			self._steps[i] = SequenceStep(values)
-		
-		sequenceFile.close()
+		logger.info('mapping compressed sequence from ' + fileName)
+		with open(fileName, 'rb') as sequenceFile:
+			self._map = mmap.mmap(sequenceFile.fileno(), 0, access=mmap.ACCESS_READ)
+		
+		headerSize = struct.calcsize(self._headerFormat)
+		if len(self._map) < headerSize:
+			self._map.close()
+			raise ValueError('the sequence file ' + fileName + ' is too short for a header')
+		
+		magic, version, pwmChannelCount, colorChannelsPerLed, colorOrder, driveLedCount, stepLengthInMilliseconds, stepCount, stepsPerBlock = struct.unpack_from(self._headerFormat, self._map)
+		if magic != self._magic or version != self._version:
+			self._map.close()
+			raise ValueError('the file ' + fileName + ' is not a sequence file of version ' + str(self._version))
+		if pwmChannelCount != self._pwmChannelCount or colorChannelsPerLed != self._colorChannelsPerLed or colorOrder != self._colorOrder or stepsPerBlock == 0:
+			self._map.close()
+			raise ValueError('the channel layout of the sequence file ' + fileName + ' is not supported')
+		
+		self._driveLedCount = driveLedCount
+		self._stepLengthInMilliseconds = stepLengthInMilliseconds
+		self._stepCount = stepCount
+		self._stepsPerBlock = stepsPerBlock
+		self._frameSize = pwmChannelCount + driveLedCount*colorChannelsPerLed
+		
+		blockCount = (stepCount + stepsPerBlock - 1)//stepsPerBlock
+		if len(self._map) < headerSize + 4*blockCount:
+			self._map.close()
+			raise ValueError('the sequence file ' + fileName + ' is truncated')
+		
+		self._index = struct.unpack_from('<' + str(blockCount) + 'I', self._map, headerSize)
+		self._data = memoryview(self._map)[headerSize + 4*blockCount:]
+		self._frame = bytearray(self._frameSize)
+		self._frameView = memoryview(self._frame)
+		self._step = -1
+		self._position = 0
+		
+	def __enter__(self):
+		return self
+		
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		
+	def close(self):
+		if self._map is None:
+			return
+		
+		self._frameView.release()
+		self._data.release()
+		self._map.close()
+		self._map = None
+		
+	def getFrame(self, step):
+		# the frame is decoded into a buffer which is reused for the next step
+		if step < 0 or step >= self._stepCount:
+			raise IndexError('step ' + str(step) + ' is not within the sequence')
+		
+		if step < self._step or step//self._stepsPerBlock != max(self._step, 0)//self._stepsPerBlock:
+			self._step = (step//self._stepsPerBlock)*self._stepsPerBlock - 1
+			self._position = self._index[step//self._stepsPerBlock]
+		
+		while self._step < step:
+			self.__decodeNextStep()
+		return self._frameView
+		
+	def getStepCount(self):
+		return self._stepCount
+		
+	def getDriveLedCount(self):
+		return self._driveLedCount
+		
+	def getStepLengthInMilliseconds(self):
+		return self._stepLengthInMilliseconds
+		
+	def isCompressed(self):
+		return True
+		
+	def __decodeNextStep(self):
+		self._step += 1
+		if self._step%self._stepsPerBlock == 0:
+			self._frame[:] = bytes(self._frameSize)
+		
+		data = self._data
+		frame = self._frameView
+		position = self._position
+		channel = 0
+		while channel < self._frameSize:
+			token = data[position]
+			position += 1
+			if token < 0x80:
+				channel += token + 1
+				continue
+			count = token - 0x7f
+			frame[channel:channel + count] = data[position:position + count]
+			position += count
+			channel += count
+		self._position = position
+		
+	@classmethod
+	def compileFromCsv(cls, csvFileName, fileName, stepLengthInMilliseconds):
+		logger.info('compressing sequence ' + csvFileName + ' into ' + fileName)
+		driveLedCount, stepCount, frames = SequenceFile.parseCsv(csvFileName)
+		frameSize = cls._pwmChannelCount + driveLedCount*cls._colorChannelsPerLed
+		
+		index = []
+		data = bytearray()
+		for step in range(stepCount):
+			if step%cls._stepsPerBlock == 0:
+				index.append(len(data))
+				previous = bytes(frameSize)
+			current = frames[step*frameSize:(step + 1)*frameSize]
+			cls.__encodeStep(previous, current, data)
+			previous = current
+		
+		header = struct.pack(cls._headerFormat, cls._magic, cls._version, cls._pwmChannelCount, cls._colorChannelsPerLed, cls._colorOrder, driveLedCount, stepLengthInMilliseconds, stepCount, cls._stepsPerBlock)
+		temporaryFileName = fileName + '.tmp'
+		
+		with open(temporaryFileName, 'wb') as sequenceFile:
+			sequenceFile.write(header)
+			sequenceFile.write(struct.pack('<' + str(len(index)) + 'I', *index))
+			sequenceFile.write(data)
+		
+		os.replace(temporaryFileName, fileName)
+		logger.info('compressed ' + str(stepCount) + ' steps with ' + str(driveLedCount) + ' drive leds from ' + str(len(frames)) + ' to ' + str(len(data)) + ' bytes')
+		
+	@classmethod
+	def __encodeStep(cls, previous, current, data):
+		channel = 0
+		while channel < len(current):
+			changed = current[channel] != previous[channel]
+			end = channel + 1
+			while end < len(current) and end - channel < cls._maximumRun and (current[end] != previous[end]) == changed:
+				end += 1
+			
+			if changed:
+				data.append(0x80 | (end - channel - 1))
+				data += current[channel:end]
+			else:
+				data.append(end - channel - 1)
+			channel = end
+	
+class Sequence:
+	def __init__(self, fileName, characteristics):
+		self._file = SequenceFile.open(fileName)
+		self._characteristics = characteristics
+		
+		# compressed steps are decoded while playing instead of being kept in memory
+		self._steps = None
+		if self._file.isCompressed():
+			self._colors = array.array('I', bytes(4*self._file.getDriveLedCount()))
+			self._colorBytes = memoryview(self._colors).cast('B')
+		else:
+			self._steps = self.__compileSteps(characteristics)
+		
+	def __enter__(self):
+		return self
+		
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		
+	@classmethod
+	def load(cls, csvFileName, fileName, stepLengthInMilliseconds, characteristics, compressed=False):
+		if not os.path.exists(fileName) or os.path.getmtime(fileName) < os.path.getmtime(csvFileName):
+			if compressed:
+				CompressedSequenceFile.compileFromCsv(csvFileName, fileName, stepLengthInMilliseconds)
+			else:
+				SequenceFile.compileFromCsv(csvFileName, fileName, stepLengthInMilliseconds)
+		
+		return cls(fileName, characteristics)
+		
+	def close(self):
+		self._file.close()
 		
 	def applyTo(self, peripherals, step):
-		self._steps[step].applyTo(peripherals)
+		if self._steps is not None:
+			self._steps[step].applyTo(peripherals)
+			return
+		
+		frame = self._file.getFrame(step)
+		self._characteristics.packDrive(frame[4:], self._colorBytes)
+		peripherals.setFrame(self._characteristics.getDutyCycles(frame[:4]), self._colors)
 		
 	def getStepCount(self):
-		return len(self._steps)
+		return self._file.getStepCount()
+		
+	def getDriveLedCount(self):
+		return self._file.getDriveLedCount()
+		
+	def getStepLengthInMilliseconds(self):
+		return self._file.getStepLengthInMilliseconds()
+		
+	def __compileSteps(self, characteristics):
+		logger.info('compiling ' + str(self.getStepCount()) + ' sequence steps')
+		start = time.time()
+		driveLedCount = self.getDriveLedCount()
+		colors = array.array('I', bytes(4*driveLedCount*self.getStepCount()))
+		colorBytes = memoryview(colors).cast('B')
+		steps = [None] * self.getStepCount()
+		
+		for i in range(self.getStepCount()):
+			frame = self._file.getFrame(i)
+			characteristics.packDrive(frame[4:], colorBytes[i*driveLedCount*4:(i + 1)*driveLedCount*4])
+			
+			stepColors = memoryview(colors)[i*driveLedCount:(i + 1)*driveLedCount]
+			steps[i] = SequenceStep(characteristics.getDutyCycles(frame[:4]), stepColors)
+		
+		logger.info('compiled sequence steps in ' + '{:.3f}'.format(time.time() - start) + 's')
+		return steps
+	
+class KeyframeSequence:
+	# sparse keyframes per channel (the pwm channels first, then red, green and blue of
+	# each drive led) which are interpolated at the render rate while playing; the easing
+	# of a keyframe shapes the transition towards the next keyframe of its channel
+	LINEAR = 'linear'
+	EASE_IN = 'ease-in'
+	EASE_OUT = 'ease-out'
+	EASE_IN_OUT = 'ease-in-out'
+	STEP = 'step'
+	easings = [LINEAR, EASE_IN, EASE_OUT, EASE_IN_OUT, STEP]
+	_version = 1
+	_pwmChannelCount = 4
+	_colorChannelsPerLed = 3
+	
+	def __init__(self, channels, driveLedCount, durationInMilliseconds, frameRate, characteristics):
+		# numpy is only needed for keyframe sequences
+		import numpy
+		self._numpy = numpy
+		self._characteristics = characteristics
+		self._driveLedCount = driveLedCount
+		self._frameLengthInMilliseconds = 1000/frameRate
+		
+		channelCount = self._pwmChannelCount + driveLedCount*self._colorChannelsPerLed
+		if len(channels) != channelCount:
+			raise ValueError('a sequence with ' + str(driveLedCount) + ' drive leds needs keyframes for ' + str(channelCount) + ' channels instead of ' + str(len(channels)))
+		
+		keyframeCount = max([len(x) for x in channels])
+		self._times = numpy.full((channelCount, keyframeCount), numpy.inf)
+		self._values = numpy.zeros((channelCount, keyframeCount))
+		self._easings = numpy.zeros((channelCount, keyframeCount), dtype=numpy.int8)
+		for channel, keyframes in enumerate(channels):
+			self.__setKeyframes(channel, keyframes)
+		
+		if durationInMilliseconds is None:
+			durationInMilliseconds = self._times[numpy.isfinite(self._times)].max()
+		# a frame is only played if it starts before the end, the rounding keeps a frame
+		# length like 1000/30ms from adding a frame to an exact multiple
+		self._stepCount = max(ceil(round(durationInMilliseconds/self._frameLengthInMilliseconds, 6)), 1)
+		
+		# the segment of each keyframe ends at the next keyframe, the last value is held
+		self._nextTimes = numpy.roll(self._times, -1, axis=1)
+		self._nextTimes[:, -1] = numpy.inf
+		self._nextValues = numpy.roll(self._values, -1, axis=1)
+		lastKeyframes = numpy.array([len(x) - 1 for x in channels])
+		self._nextValues[numpy.arange(channelCount), lastKeyframes] = self._values[numpy.arange(channelCount), lastKeyframes]
+		self._channels = numpy.arange(channelCount)
+		
+		self._colors = array.array('I', bytes(4*driveLedCount))
+		self._colorBytes = memoryview(self._colors).cast('B')
+		logger.info('loaded ' + str(int(numpy.isfinite(self._times).sum())) + ' keyframes on ' + str(channelCount) + ' channels, playing ' + str(self._stepCount) + ' frames at ' + '{:.1f}'.format(frameRate) + 'fps')
+		
+	def __enter__(self):
+		return self
+		
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		
+	@classmethod
+	def load(cls, fileName, csvFileName, stepLengthInMilliseconds, frameRate, characteristics):
+		# sequences which only exist as csv are imported as linear keyframes
+		if os.path.exists(csvFileName) and (not os.path.exists(fileName) or os.path.getmtime(fileName) < os.path.getmtime(csvFileName)):
+			cls.importFromCsv(csvFileName, fileName, stepLengthInMilliseconds)
+		
+		return cls.open(fileName, frameRate, characteristics)
+		
+	@classmethod
+	def open(cls, fileName, frameRate, characteristics):
+		with open(fileName, 'r') as keyframeFile:
+			content = json.load(keyframeFile)
+		if content.get('version') != cls._version:
+			raise ValueError('the file ' + fileName + ' is not a keyframe sequence of version ' + str(cls._version))
+		return cls(content['channels'], content['driveLedCount'], content.get('durationInMilliseconds'), frameRate, characteristics)
+		
+	@classmethod
+	def importFromCsv(cls, csvFileName, fileName, stepLengthInMilliseconds):
+		import numpy
+		logger.info('importing sequence ' + csvFileName + ' as keyframes into ' + fileName)
+		
+		driveLedCount, stepCount, frames = SequenceFile.parseCsv(csvFileName)
+		frames = numpy.frombuffer(frames, dtype=numpy.uint8).reshape(stepCount, -1).T.astype(numpy.int16)
+		
+		# a step only needs a keyframe where the slope of its channel changes
+		slopes = numpy.diff(frames, axis=1)
+		edges = numpy.ones((len(frames), 1), dtype=bool)
+		keep = numpy.concatenate([edges, slopes[:, 1:] != slopes[:, :-1], edges], axis=1) if stepCount > 1 else edges
+		channels = []
+		for channel in range(len(frames)):
+			steps = numpy.flatnonzero(keep[channel])
+			channels.append([[int(x)*stepLengthInMilliseconds, int(frames[channel, x])] for x in steps])
+		
+		content = {'version': cls._version, 'driveLedCount': driveLedCount, 'durationInMilliseconds': stepCount*stepLengthInMilliseconds, 'channels': channels}
+		temporaryFileName = fileName + '.tmp'
+		with open(temporaryFileName, 'w') as keyframeFile:
+			json.dump(content, keyframeFile, separators=(',', ':'))
+		os.replace(temporaryFileName, fileName)
+		logger.info('imported ' + str(int(keep.sum())) + ' keyframes from ' + str(stepCount) + ' steps')
+		
+	def close(self):
+		pass
+		
+	def applyTo(self, peripherals, step):
+		frame = memoryview(self.__evaluate(step*self._frameLengthInMilliseconds).tobytes())
+		self._characteristics.packDrive(frame[self._pwmChannelCount:], self._colorBytes)
+		peripherals.setFrame(self._characteristics.getDutyCycles(frame[:self._pwmChannelCount]), self._colors)
+		
+	def getStepCount(self):
+		return self._stepCount
 		
 	def getDriveLedCount(self):
 		return self._driveLedCount
+		
+	def getStepLengthInMilliseconds(self):
+		return self._frameLengthInMilliseconds
+		
+	def __evaluate(self, timeInMilliseconds):
+		numpy = self._numpy
+		# all channels are interpolated at once, each within its current segment
+		index = numpy.maximum((self._times <= timeInMilliseconds).sum(axis=1) - 1, 0)
+		start = self._times[self._channels, index]
+		position = numpy.clip((timeInMilliseconds - start)/(self._nextTimes[self._channels, index] - start), 0, 1)
+		eased = numpy.choose(self._easings[self._channels, index], [position, position*position, position*(2 - position), position*position*(3 - 2*position), numpy.zeros_like(position)])
+		startValue = self._values[self._channels, index]
+		return numpy.rint(startValue + (self._nextValues[self._channels, index] - startValue)*eased).astype(numpy.uint8)
+		
+	def __setKeyframes(self, channel, keyframes):
+		if len(keyframes) == 0:
+			raise ValueError('channel ' + str(channel) + ' has no keyframes')
+		
+		previousTime = -1
+		for i, keyframe in enumerate(keyframes):
+			keyframeTime, value = keyframe[0], keyframe[1]
+			easing = keyframe[2] if len(keyframe) > 2 else self.LINEAR
+			if keyframeTime <= previousTime:
+				raise ValueError('the keyframes of channel ' + str(channel) + ' must have increasing times')
+			if value < 0 or value > 255:
+				raise ValueError('the keyframe values of channel ' + str(channel) + ' must be within 0 and 255')
+			if easing not in self.easings:
+				raise ValueError('the easing of channel ' + str(channel) + ' must be one of ' + ', '.join(self.easings))
+			self._times[channel, i] = keyframeTime
+			self._values[channel, i] = value
+			self._easings[channel, i] = self.easings.index(easing)
+			previousTime = keyframeTime
+		
+class SequenceLibrary:
+	# a directory of sequences which may be described by a manifest like
+	# {"default": "take-off", "sequences": {"take-off": {"file": "take-off.csv", "audio": "take_off.wav"}}},
+	# without a manifest each csv file is a sequence named like the file; the compiled
+	# sequences are cached under the hash of their content and the cache index keeps the
+	# hash of each source by size and modification time, so unchanged files are not read
+	_manifestFileName = 'manifest.json'
+	_indexFileName = 'index.json'
+	_cacheFilePattern = re.compile('[0-9a-f]{64}-[a-z]+-[0-9]+\\.(bin|json)$')
+	_defaultAudioFileName = 'take_off.wav'
 	
+	def __init__(self, directory, cacheDirectory, stepLengthInMilliseconds, characteristics, renderRate, compressed, audioDirectory):
+		self._directory = directory
+		self._defaultAudioFile = os.path.join(audioDirectory, self._defaultAudioFileName)
+		self._cacheDirectory = cacheDirectory
+		self._stepLength = stepLengthInMilliseconds
+		self._characteristics = characteristics
+		self._renderRate = renderRate
+		self._compressed = compressed
+		self._sequences = {}
+		self._defaultName = None
+		self._index = self.__readIndex()
+		
+	def refresh(self):
+		# compiles new and changed sequences and tells whether any sequence changed
+		manifest = self.__readManifest()
+		sequences = {}
+		sourceFileNames = []
+		for name, entry in manifest['sequences'].items():
+			if 'file' not in entry:
+				logger.warning('skipping sequence ' + name + ': the manifest names no file for it')
+				continue
+			sourceFileName = os.path.join(self._directory, entry['file'])
+			sourceFileNames.append(sourceFileName)
+			audioFile = os.path.join(self._directory, entry.get('audio', self._defaultAudioFile))
+			if not os.path.isfile(audioFile):
+				logger.error('skipping sequence ' + name + ': the audio file ' + audioFile + ' does not exist')
+				continue
+			try:
+				sequences[name] = (self.__compile(sourceFileName), audioFile)
+			except (OSError, ValueError) as e:
+				logger.error('skipping sequence ' + name + ': ' + str(e))
+		
+		if len(sequences) == 0:
+			raise ValueError('the sequence library ' + self._directory + ' contains no sequence')
+		defaultName = manifest.get('default')
+		if defaultName not in sequences:
+			defaultName = sorted(sequences)[0]
+		
+		changed = sequences != self._sequences or defaultName != self._defaultName
+		self._index = dict([(x, y) for x, y in self._index.items() if x in sourceFileNames])
+		self._sequences = sequences
+		self._defaultName = defaultName
+		self.__writeIndex()
+		self.__removeUnusedCacheFiles()
+		logger.info('sequence library contains ' + ', '.join(sorted(sequences)) + (', changed' if changed else ', unchanged'))
+		return changed
+		
+	def load(self, name):
+		cacheFileName = self._sequences[name][0]
+		logger.info('loading sequence ' + name)
+		if self._renderRate > 0:
+			return KeyframeSequence.open(cacheFileName, self._renderRate, self._characteristics)
+		return Sequence(cacheFileName, self._characteristics)
+		
+	def getNames(self):
+		return sorted(self._sequences)
+		
+	def getDefaultName(self):
+		return self._defaultName
+		
+	def getAudioFile(self, name):
+		return self._sequences[name][1]
+		
+	def getAudioFiles(self):
+		return sorted(set([x[1] for x in self._sequences.values()]))
+		
+	def getSignature(self):
+		# checking the sizes and modification times is cheap enough to be polled
+		signature = []
+		try:
+			with os.scandir(self._directory) as entries:
+				for entry in entries:
+					if entry.is_file():
+						status = entry.stat()
+						signature.append((entry.name, status.st_size, status.st_mtime_ns))
+		except FileNotFoundError:
+			pass
+		return tuple(sorted(signature))
+		
+	def __readManifest(self):
+		manifestFileName = os.path.join(self._directory, self._manifestFileName)
+		if os.path.exists(manifestFileName):
+			with open(manifestFileName, 'r') as manifestFile:
+				return json.load(manifestFile)
+		
+		names = [x for x in sorted(os.listdir(self._directory)) if x.endswith('.csv')]
+		return {'sequences': dict([(os.path.splitext(x)[0], {'file': x}) for x in names])}
+		
+	def __compile(self, sourceFileName):
+		status = os.stat(sourceFileName)
+		indexEntry = self._index.get(sourceFileName)
+		if indexEntry is not None and indexEntry['size'] == status.st_size and indexEntry['mtime'] == status.st_mtime_ns:
+			contentHash = indexEntry['hash']
+		else:
+			with open(sourceFileName, 'rb') as sourceFile:
+				contentHash = hashlib.sha256(sourceFile.read()).hexdigest()
+			self._index[sourceFileName] = {'size': status.st_size, 'mtime': status.st_mtime_ns, 'hash': contentHash}
+		
+		if sourceFileName.endswith('.json'):
+			if self._renderRate == 0:
+				raise ValueError('keyframe sequences can only be played with a render rate')
+			return sourceFileName
+		
+		if self._renderRate > 0:
+			cacheFileName = self.__getCacheFileName(contentHash, 'keyframes', '.json')
+			if not os.path.exists(cacheFileName):
+				KeyframeSequence.importFromCsv(sourceFileName, cacheFileName, self._stepLength)
+		elif self._compressed:
+			cacheFileName = self.__getCacheFileName(contentHash, 'compressed', '.bin')
+			if not os.path.exists(cacheFileName):
+				CompressedSequenceFile.compileFromCsv(sourceFileName, cacheFileName, self._stepLength)
+		else:
+			cacheFileName = self.__getCacheFileName(contentHash, 'steps', '.bin')
+			if not os.path.exists(cacheFileName):
+				SequenceFile.compileFromCsv(sourceFileName, cacheFileName, self._stepLength)
+		return cacheFileName
+		
+	def __getCacheFileName(self, contentHash, kind, extension):
+		return os.path.join(self._cacheDirectory, contentHash + '-' + kind + '-' + str(self._stepLength) + extension)
+		
+	def __readIndex(self):
+		os.makedirs(self._cacheDirectory, exist_ok=True)
+		try:
+			with open(os.path.join(self._cacheDirectory, self._indexFileName), 'r') as indexFile:
+				return json.load(indexFile)
+		except (OSError, ValueError):
+			return {}
+		
+	def __writeIndex(self):
+		indexFileName = os.path.join(self._cacheDirectory, self._indexFileName)
+		with open(indexFileName + '.tmp', 'w') as indexFile:
+			json.dump(self._index, indexFile)
+		os.replace(indexFileName + '.tmp', indexFileName)
+		
+	def __removeUnusedCacheFiles(self):
+		# only compiled sequences are removed, other files in the directory are left alone
+		used = set([os.path.basename(x[0]) for x in self._sequences.values()])
+		for fileName in os.listdir(self._cacheDirectory):
+			if self._cacheFilePattern.match(fileName) and fileName not in used:
+				os.remove(os.path.join(self._cacheDirectory, fileName))
+		
+class SequenceLibraryWatcher:
+	# inotify is not available without further dependencies, so the directory is polled
+	def __init__(self, library, events, intervalInSeconds):
+		self._library = library
+		self._events = events
+		self._interval = intervalInSeconds
+		self._stopped = threading.Event()
+		self._thread = None
+		
+	def __enter__(self):
+		self._thread = threading.Thread(target=self.__run, name='library-watcher', daemon=True)
+		self._thread.start()
+		return self
+		
+	def __exit__(self, exc_type, exc_value, traceback):
+		self._stopped.set()
+		self._thread.join()
+		
+	def __run(self):
+		signature = self._library.getSignature()
+		while not self._stopped.wait(self._interval):
+			currentSignature = self._library.getSignature()
+			if currentSignature != signature:
+				logger.info('the sequence library changed')
+				signature = currentSignature
+				self._events.put(EventQueue.LIBRARY_CHANGED)
+		
+class ControlServer:
+	# each line is a json command or a list of commands; start, stop and seek are queued as
+	# one batch and applied by the playback at the next frame boundary, status and stream
+	# are answered right away by the server thread
+	_deferredCommands = ['start', 'stop', 'seek', 'profile', 'memory']
+	_immediateCommands = ['status', 'stream']
+	_maximumStreamBufferSizeInBytes = 64*1024
+	
+	def __init__(self, events, socketFileName, port):
+		self._events = events
+		self._socketFileName = socketFileName
+		self._port = port
+		self._statusProvider = lambda: {}
+		self._batches = queue.SimpleQueue()
+		self._connections = set()
+		self._subscribers = set()
+		self._frameCount = 0
+		self._droppedStreamFrameCount = 0
+		self._loop = None
+		self._stopped = None
+		self._started = threading.Event()
+		self._error = None
+		self._thread = None
+		
+	def __enter__(self):
+		self._thread = threading.Thread(target=asyncio.run, args=(self.__serve(),), name='control', daemon=True)
+		self._thread.start()
+		self._started.wait()
+		if self._error is not None:
+			raise self._error
+		return self
+		
+	def __exit__(self, exc_type, exc_value, traceback):
+		if self._error is None:
+			self._loop.call_soon_threadsafe(self._stopped.set)
+		self._thread.join()
+		logger.info('control server: ' + str(self._frameCount) + ' frames streamed, ' + str(self._droppedStreamFrameCount) + ' dropped for slow clients')
+		
+	def setStatusProvider(self, statusProvider):
+		self._statusProvider = statusProvider
+		
+	def takeBatches(self):
+		batches = []
+		while True:
+			try:
+				batches.append(self._batches.get_nowait())
+			except queue.Empty:
+				return batches
+		
+	def publishFrame(self, dutyCycles, colors):
+		# the render loop only pays for a copy of the frame while a client is streaming
+		if not self._subscribers:
+			return
+		self._loop.call_soon_threadsafe(self.__broadcast, tuple(dutyCycles), bytes(colors))
+		
+	async def __serve(self):
+		self._loop = asyncio.get_running_loop()
+		self._stopped = asyncio.Event()
+		servers = []
+		try:
+			if self._socketFileName:
+				if os.path.exists(self._socketFileName):
+					os.unlink(self._socketFileName)
+				servers.append(await asyncio.start_unix_server(self.__handleConnection, path=self._socketFileName))
+				os.chmod(self._socketFileName, 0o660)
+				logger.info('control server listening on ' + self._socketFileName)
+			if self._port > 0:
+				servers.append(await asyncio.start_server(self.__handleConnection, '127.0.0.1', self._port))
+				logger.info('control server listening on port ' + str(self._port))
+		except Exception as e:
+			self._error = e
+			for server in servers:
+				server.close()
+			return
+		finally:
+			self._started.set()
+		
+		await self._stopped.wait()
+		for server in servers:
+			server.close()
+		for writer in list(self._connections):
+			writer.close()
+		for server in servers:
+			await server.wait_closed()
+		if self._socketFileName and os.path.exists(self._socketFileName):
+			os.unlink(self._socketFileName)
+		
+	async def __handleConnection(self, reader, writer):
+		self._connections.add(writer)
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				writer.write((json.dumps(self.__handleLine(line, writer)) + '\n').encode())
+				await writer.drain()
+		except (ConnectionError, ValueError):
+			# a line longer than the stream limit ends the connection as well
+			pass
+		finally:
+			self._subscribers.discard(writer)
+			self._connections.discard(writer)
+			writer.close()
+		
+	def __handleLine(self, line, writer):
+		try:
+			commands = json.loads(line)
+			if not isinstance(commands, list):
+				commands = [commands]
+			for command in commands:
+				self.__validate(command)
+		except ValueError as e:
+			return {'error': str(e)}
+		
+		reply = {}
+		batch = [x for x in commands if x['command'] in self._deferredCommands]
+		if batch:
+			self._batches.put(batch)
+			self._events.put(EventQueue.CONTROL)
+			reply['queued'] = len(batch)
+		for command in commands:
+			if command['command'] == 'stream':
+				if command.get('enabled', True):
+					self._subscribers.add(writer)
+				else:
+					self._subscribers.discard(writer)
+				reply['streaming'] = writer in self._subscribers
+			elif command['command'] == 'status':
+				reply['status'] = self._statusProvider()
+		return reply
+		
+	def __validate(self, command):
+		if not isinstance(command, dict) or command.get('command') not in self._deferredCommands + self._immediateCommands:
+			raise ValueError('each command must be an object with a command out of ' + ', '.join(self._deferredCommands + self._immediateCommands))
+		if command['command'] == 'start' and 'sequence' in command and command['sequence'] not in self._statusProvider().get('sequences', []):
+			raise ValueError('there is no sequence ' + str(command['sequence']))
+		if command['command'] == 'seek' and (not isinstance(command.get('position'), (int, float)) or command['position'] < 0):
+			raise ValueError('seek needs a position in milliseconds')
+		if command['command'] == 'seek' and not self._statusProvider().get('seekable', True):
+			raise ValueError('the audio of the playing sequence cannot be moved')
+		if command['command'] == 'profile' and not isinstance(command.get('enabled', True), bool):
+			raise ValueError('enabled must be true or false')
+		
+	def __broadcast(self, dutyCycles, colors):
+		self._frameCount += 1
+		line = (json.dumps({'frame': {'dutyCycles': dutyCycles, 'colors': array.array('I', colors).tolist()}}) + '\n').encode()
+		for writer in self._subscribers:
+			if writer.transport.get_write_buffer_size() > self._maximumStreamBufferSizeInBytes:
+				# a slow client misses frames instead of piling them up in memory
+				self._droppedStreamFrameCount += 1
+			else:
+				writer.write(line)
+		
+class DisabledControlServer:
+	def __enter__(self):
+		return self
+		
+	def __exit__(self, exc_type, exc_value, traceback):
+		pass
+		
+	def setStatusProvider(self, statusProvider):
+		pass
+		
+	def takeBatches(self):
+		return []
+		
+	def publishFrame(self, dutyCycles, colors):
+		pass
+		
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+	def do_GET(self):
+		if self.path != '/metrics':
+			self.send_error(404)
+			return
+		body = self.server.metrics.format().encode()
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/plain; version=0.0.4')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+		
+	def log_message(self, format, *arguments):
+		logger.debug('metrics request: ' + format % arguments)
+		
+class MetricsExporter:
+	# the metrics are served over http for scraping and written to a file for the textfile
+	# collector of the node exporter, both are optional
+	def __init__(self, metrics, address, port, fileName, intervalInSeconds):
+		self._metrics = metrics
+		self._address = address
+		self._port = port
+		self._fileName = fileName
+		self._interval = intervalInSeconds
+		self._server = None
+		self._threads = []
+		self._stopped = threading.Event()
+		
+	def __enter__(self):
+		if self._port > 0:
+			self._server = ThreadingHTTPServer((self._address, self._port), MetricsRequestHandler)
+			self._server.metrics = self._metrics
+			self._threads.append(threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True))
+			logger.info('serving metrics on ' + self._address + ':' + str(self._port))
+		if self._fileName:
+			self._threads.append(threading.Thread(target=self.__writePeriodically, name='metrics-file', daemon=True))
+		for thread in self._threads:
+			thread.start()
+		return self
+		
+	def __exit__(self, exc_type, exc_value, traceback):
+		self._stopped.set()
+		if self._server is not None:
+			self._server.shutdown()
+			self._server.server_close()
+		for thread in self._threads:
+			thread.join()
+		
+	def __writePeriodically(self):
+		while True:
+			stopped = self._stopped.wait(self._interval)
+			try:
+				self.__write()
+			except OSError:
+				logger.exception('failed to write the metrics to ' + self._fileName)
+			if stopped:
+				return
+		
+	def __write(self):
+		# the file is replaced at once, so a collector never reads it half written
+		directory = os.path.dirname(os.path.abspath(self._fileName))
+		with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as metricsFile:
+			metricsFile.write(self._metrics.format())
+		os.chmod(metricsFile.name, 0o644)
+		os.replace(metricsFile.name, self._fileName)
+		
+class StartupTimeline:
+	def __init__(self):
+		self._start = time.monotonic_ns()
+		self._steps = []
+		self._logged = False
+		self._lock = threading.Lock()
+		
+	def measure(self, name, function, *arguments):
+		start = time.monotonic_ns()
+		try:
+			return function(*arguments)
+		finally:
+			self.record(name, start, time.monotonic_ns())
+		
+	def record(self, name, start, end):
+		with self._lock:
+			self._steps.append((start - self._start, end - self._start, name))
+			logged = self._logged
+		# steps which finish after the timeline was logged, like the boot animation, are logged on their own
+		if logged:
+			self.__logStep(start - self._start, end - self._start, name)
+		
+	def mark(self, name):
+		now = time.monotonic_ns()
+		self.record(name, now, now)
+		
+	def log(self):
+		with self._lock:
+			self._logged = True
+			steps = sorted(self._steps)
+		for start, end, name in steps:
+			self.__logStep(start, end, name)
+		
+	def __logStep(self, start, end, name):
+		logger.info('startup ' + '{:7.3f}'.format(start/1000000000) + 's to ' + '{:7.3f}'.format(end/1000000000) + 's ' + name + ' (' + '{:.3f}'.format((end - start)/1000000000) + 's)')
+		
 class Falcon:
 	_sequenceExecuted = False
+	_sequence = None
+	_scheduler = None
 	_iterationStepInMilliseconds = 200
+	_bootInitializedCue = 'bootup_sequence_initialized.wav'
+	_bootFinishedCue = 'bootup_sequence_finished.wav'
+	_audioCues = [_bootInitializedCue, _bootFinishedCue, SequenceLibrary._defaultAudioFileName]
 
-	def __init__(self, signalHandler):
+	def __init__(self, *, backend, events, signalHandler, trace, framePolicy, characteristics, clock, audioCacheSizeInBytes, audioStreamThresholdInBytes, audioDirectory, timeline, renderThread, driveMode, reactiveFrameRate, reactiveBandCount, library, driveSegments, control, metrics, profiler):
+		# the arguments are keyword only, with this many of them a swapped pair would go unnoticed
 		logger.info("initializing led falcon")
-		self._peripherals = Peripherals()
-		self._audioPlayer = AudioPlayer()
+		self._events = events
+		self._audioDirectory = audioDirectory
+		self._profiler = profiler
+		self._metrics = metrics
+		self._control = control
+		self._playing = False
+		self._startRequested = False
+		self._requestedSequenceName = None
+		self._remoteShow = False
+		self._stopRequested = False
+		self._seekPosition = None
+		self._framePolicy = framePolicy
+		self._renderThread = renderThread
+		self._driveMode = driveMode
+		self._reactiveFrameRate = reactiveFrameRate
+		self._reactiveBandCount = reactiveBandCount
+		self._library = library
+		self._sequenceName = None
+		self._libraryChanged = False
+		self._clock = clock
+		self._characteristics = characteristics
+		self._timeline = timeline
+		self._bootAnimation = None
+		self._bootAnimationCancelled = threading.Event()
+		
+		# the gpio setup and the mixer initialization do not depend on each other
+		with ThreadPoolExecutor(max_workers=2, thread_name_prefix='startup') as executor:
+			peripherals = executor.submit(timeline.measure, 'peripherals', Peripherals, backend, events, characteristics, driveSegments)
+			audioPlayer = executor.submit(timeline.measure, 'audio player', AudioPlayer, backend, audioCacheSizeInBytes, audioStreamThresholdInBytes, metrics)
+			self._peripherals = peripherals.result()
+			self._audioPlayer = audioPlayer.result()
+		
 		self._signalHandler = signalHandler
+		self._trace = trace
+		self._startPressed = self._peripherals.isStartPressed()
+		self._control.setStatusProvider(self.getStatus)
 		
 	def __enter__(self):
 		return self
 		
 	def __exit__(self, exc_type, exc_value, traceback):
+		self.__stopBootAnimation()
 		self._peripherals.__exit__(exc_type, exc_value, traceback)
 		self._audioPlayer.__exit__(exc_type, exc_value, traceback)
+		if self._sequence is not None:
+			self._sequence.close()
 		
 	def bootSequence(self):
 		logger.info('starting boot sequence')
-		self._audioPlayer.play('/usr/share/falcon/audio/bootup_sequence_initialized.wav')
-		
-		self._sequence = Sequence('/usr/share/falcon/sequence.csv')
-		
-		for x in range(0, 10):
-			value = x/10
-			self._peripherals.setFront(value)
-			time.sleep(0.1)
-		self._peripherals.setFront(0)
-		
-		for x in range(0, 10):
-			value = x/10
-			self._peripherals.setCockpit(value)
-			time.sleep(0.1)
-		self._peripherals.setCockpit(0)
-		
-		for x in range(0, 10):
-			value = x/10
-			self._peripherals.setTurret(value)
-			time.sleep(0.1)
-		self._peripherals.setTurret(0)
-		
-		for x in range(0, 10):
-			value = x/10
-			self._peripherals.setLandingGearAndRamp(value)
-			time.sleep(0.1)
-		self._peripherals.setLandingGearAndRamp(0)
-		
-		for x in range(self._sequence.getDriveLedCount()):
-			self._peripherals.setDrive(x, Color(255, 255, 255))
-			time.sleep(0.1)
-			self._peripherals.setDrive(x, Color(0, 0, 0))
-		
-		self._audioPlayer.play('/usr/share/falcon/audio/bootup_sequence_finished.wav')
-		time.sleep(3.5)
+		self._audioPlayer.play(os.path.join(self._audioDirectory, self._bootInitializedCue))
+		
+		# the files are loaded in the background while the animation is shown,
+		# the falcon is ready as soon as both are loaded
+		with ThreadPoolExecutor(max_workers=2, thread_name_prefix='startup') as executor:
+			sequence = executor.submit(self._timeline.measure, 'sequence', self.__loadLibrary)
+			audioCues = executor.submit(self._timeline.measure, 'audio cues', self._audioPlayer.preload, [os.path.join(self._audioDirectory, x) for x in self._audioCues])
+			self._bootAnimation = threading.Thread(target=self.__runBootAnimation, args=(sequence, audioCues), name='boot-animation', daemon=True)
+			self._bootAnimation.start()
+			
+			self._sequence = sequence.result()
+			audioCues.result()
+		
+		self._audioPlayer.preload(self._library.getAudioFiles())
+		self._timeline.mark('ready')
+		self._timeline.log()
 		logger.info('finished boot sequence')
 		
 	def runOnce(self):
-		if not self._peripherals.shouldRun():
+		if self._startRequested:
+			# a show started by a control command runs regardless of the button
+			self._startRequested = False
+			if not self.__switchToRequestedSequence():
+				return
+			self._remoteShow = True
+		elif not self._startPressed:
 			self._sequenceExecuted = False
 			return
-			
-		if self._sequenceExecuted:
+		elif self._sequenceExecuted:
 			return
 			
 		logger.info('sequence should run')
-		self._audioPlayer.play('/usr/share/falcon/audio/take_off.wav')
+		self._stopRequested = False
+		self._playing = True
+		self._metrics.shows.increment()
+		self.__stopBootAnimation()
+		self._audioPlayer.play(self._library.getAudioFile(self._sequenceName))
+		self._trace.record(TraceBuffer.SEQUENCE_START, self._sequence.getStepCount())
 		
-		start = time.time()
+		renderPipeline = RenderPipeline(self._peripherals, self._sequence.getDriveLedCount(), self._renderThread, self._control.publishFrame, self._metrics)
+		renderPipeline.start()
+		target = renderPipeline
+		reactiveDrive = None
+		if self._driveMode == 'audio':
+			reactiveDrive = AudioReactiveDrive(self._audioPlayer, renderPipeline, self._characteristics, self._sequence.getDriveLedCount(), self._reactiveFrameRate, self._reactiveBandCount, self._metrics)
+			reactiveDrive.start()
+			target = reactiveDrive
+		
+		self._clock.start(self._audioPlayer)
+		self._scheduler = FrameScheduler(self._sequence.getStepCount(), self._sequence.getStepLengthInMilliseconds(), self._framePolicy, self._trace, self.__handleEvents, self._clock, self._metrics)
 		
 		while True:
-			iterationStep = self.__calculateIterationStep(start)
+			iterationStep = self._scheduler.waitForNextFrame()
 			
-			if (iterationStep >= self._sequence.getStepCount()):
+			if self._stopRequested or self._startRequested:
+				logger.info('sequence should stop due to a control command')
+				self._trace.record(TraceBuffer.STOP_BY_USER, self._scheduler.getRenderedFrameCount())
 				break
 			
-			if not self._peripherals.shouldRun():
+			if not self._startPressed and not self._remoteShow:
 				logger.info('sequence should stop due to user input')
+				self._trace.record(TraceBuffer.STOP_BY_USER, self._scheduler.getRenderedFrameCount())
 				break
 			
 			if self._signalHandler.checkIfShouldBeStopped():
 				logger.info('sequence should stop due to system signal')
+				self._trace.record(TraceBuffer.STOP_BY_SIGNAL, self._scheduler.getRenderedFrameCount())
 				break
 			
-			logger.info('iteration step ' + str(iterationStep) + ' of ' + str(self._sequence.getStepCount()))
-			self._sequence.applyTo(self._peripherals, iterationStep)
+			if iterationStep is not None and self._seekPosition is not None:
+				iterationStep = self.__seek(self._seekPosition, iterationStep)
+				self._seekPosition = None
 			
-			current = time.time()
-			waitTime = (((iterationStep + 1) * self._iterationStepInMilliseconds)/1000 + start) - current
-			waitTime = max(waitTime, 0)
-			logger.info('waiting for ' + '{:.3f}'.format(waitTime) + 's')
-			time.sleep(waitTime)
-		
-		for i in range(self._sequence.getDriveLedCount()):
-			self._peripherals.setDrive(i, Color(0, 0, 0))
+			if iterationStep is None:
+				break
+			
+			self._trace.record(TraceBuffer.STEP, iterationStep)
+			start = time.monotonic_ns()
+			self._sequence.applyTo(target, iterationStep)
+			self._metrics.frameBuildTime.add(time.monotonic_ns() - start)
+			self._trace.record(TraceBuffer.STEP_APPLIED, iterationStep)
 		
+		if reactiveDrive is not None:
+			reactiveDrive.stop()
+		renderPipeline.stop()
+		self._trace.record(TraceBuffer.SEQUENCE_END, self._scheduler.getRenderedFrameCount())
+		self._scheduler.logStatistics()
+		self._clock.logStatistics()
+		renderPipeline.logStatistics()
+		if reactiveDrive is not None:
+			reactiveDrive.logStatistics()
+		self._peripherals.turnOffDrive()
 		self._peripherals.setAll(0)
 		self._audioPlayer.stop()
+		self._peripherals.logOutputStatistics()
+		self._audioPlayer.logStatistics()
 		self._sequenceExecuted = True
+		self._playing = False
+		self._remoteShow = False
+		self._stopRequested = False
+		if not self._startRequested:
+			self._seekPosition = None
+		
+	def waitForEvent(self):
+		# the stop event may already have been taken while a show was playing
+		if self._signalHandler.checkIfShouldBeStopped():
+			return
+		
+		# a show which was requested while another one was playing starts right away
+		self.__handleEvents(0 if self._startRequested else None)
 		
-	def __calculateIterationStep(self, start):
-		current = time.time()
-		return int((current - start)*1000/self._iterationStepInMilliseconds)
+		# a changed library is only picked up between two shows
+		if self._libraryChanged:
+			self.__reloadLibrary()
+		
+	def getLastFrameScheduler(self):
+		return self._scheduler
+		
+	def getStatus(self):
+		# called from the control server thread, so only plain attributes are read
+		status = {'playing': self._playing, 'sequence': self._sequenceName, 'sequences': self._library.getNames(), 'startPressed': self._startPressed, 'profiling': self._profiler.isRunning()}
+		scheduler = self._scheduler
+		sequence = self._sequence
+		if self._playing and scheduler is not None:
+			status['position'] = max(scheduler.getNextFrame() - 1, 0)*sequence.getStepLengthInMilliseconds()
+			status['duration'] = scheduler.getFrameCount()*sequence.getStepLengthInMilliseconds()
+			status['renderedFrames'] = scheduler.getRenderedFrameCount()
+			status['droppedFrames'] = scheduler.getDroppedFrameCount()
+			status['seekable'] = self._audioPlayer.canSeek()
+		return status
+		
+	def __seek(self, positionInMilliseconds, iterationStep):
+		# the audio, the clock and the frames are moved together, otherwise the lights
+		# would run ahead of or behind the soundtrack for the rest of the show
+		if not self._audioPlayer.canSeek():
+			logger.warning('ignoring seek, the audio of sequence ' + self._sequenceName + ' cannot be moved')
+			return iterationStep
+		# the playback may end up somewhere else than requested, the lights follow the audio
+		positionInMilliseconds = self._audioPlayer.seek(positionInMilliseconds)
+		self._clock.seek(int(positionInMilliseconds*1000000))
+		return self._scheduler.seek(int(positionInMilliseconds*1000000))
+		
+	def __loadLibrary(self):
+		self._library.refresh()
+		self._sequenceName = self._library.getDefaultName()
+		return self.__loadSequence(self._sequenceName)
+		
+	def __loadSequence(self, name):
+		start = time.monotonic_ns()
+		sequence = self._library.load(name)
+		self._metrics.sequenceLoadTime.add(time.monotonic_ns() - start)
+		if sequence.getDriveLedCount() != self._peripherals.getDriveLedCount():
+			sequence.close()
+			raise ValueError('the sequence ' + name + ' has ' + str(sequence.getDriveLedCount()) + ' drive leds, but the drive has ' + str(self._peripherals.getDriveLedCount()))
+		return sequence
+		
+	def __reloadLibrary(self):
+		self._libraryChanged = False
+		try:
+			if not self._library.refresh():
+				return
+			
+			self._audioPlayer.preload(self._library.getAudioFiles())
+			name = self._sequenceName if self._sequenceName in self._library.getNames() else self._library.getDefaultName()
+			sequence = self.__loadSequence(name)
+		except Exception:
+			logger.exception('failed to reload the sequence library, keeping sequence ' + self._sequenceName)
+			return
+		
+		self.__switchSequence(name, sequence)
+		
+	def __switchToRequestedSequence(self):
+		name = self._requestedSequenceName
+		if name is None or name == self._sequenceName:
+			return True
+		try:
+			sequence = self.__loadSequence(name)
+		except Exception:
+			logger.exception('failed to load the requested sequence ' + name + ', keeping sequence ' + self._sequenceName)
+			return False
+		self.__switchSequence(name, sequence)
+		return True
+		
+	def __switchSequence(self, name, sequence):
+		previousSequence = self._sequence
+		self._sequence = sequence
+		self._sequenceName = name
+		previousSequence.close()
+		logger.info('switched to sequence ' + name)
+		
+	def __runBootAnimation(self, sequence, audioCues):
+		start = time.monotonic_ns()
+		cancelled = self._bootAnimationCancelled
+		
+		for setOutput in [self._peripherals.setFront, self._peripherals.setCockpit, self._peripherals.setTurret, self._peripherals.setLandingGearAndRamp]:
+			for x in range(0, 10):
+				setOutput(x/10)
+				if cancelled.wait(0.1):
+					setOutput(0)
+					return
+			setOutput(0)
+		
+		# the length of the drive is only known once the sequence is loaded
+		for x in range(sequence.result().getDriveLedCount()):
+			self._peripherals.setDrive(x, 0xffffff)
+			stopped = cancelled.wait(0.1)
+			self._peripherals.setDrive(x, 0)
+			if stopped:
+				return
+		
+		audioCues.result()
+		if not cancelled.is_set():
+			self._audioPlayer.play(os.path.join(self._audioDirectory, self._bootFinishedCue))
+		self._timeline.record('boot animation', start, time.monotonic_ns())
+		
+	def __stopBootAnimation(self):
+		if self._bootAnimation is not None:
+			self._bootAnimationCancelled.set()
+			self._bootAnimation.join()
+			self._bootAnimation = None
+		
+	def __handleEvents(self, timeout):
+		event = self._events.wait(timeout)
+		
+		while event is not None:
+			if event == EventQueue.START_PRESSED:
+				self._startPressed = True
+			elif event == EventQueue.START_RELEASED:
+				self._startPressed = False
+			elif event == EventQueue.LIBRARY_CHANGED:
+				self._libraryChanged = True
+			elif event == EventQueue.TOGGLE_PROFILER:
+				self._profiler.toggle()
+			elif event == EventQueue.CONTROL:
+				for batch in self._control.takeBatches():
+					for command in batch:
+						self.__applyControlCommand(command)
+			event = self._events.wait(0)
+		
+		if self._stopRequested or self._startRequested:
+			return False
+		return (self._startPressed or self._remoteShow) and not self._signalHandler.checkIfShouldBeStopped()
+		
+	def __applyControlCommand(self, command):
+		# the commands are applied between two frames, seeking takes effect with the next frame
+		logger.info('control command ' + json.dumps(command))
+		if command['command'] == 'start':
+			self._startRequested = True
+			self._requestedSequenceName = command.get('sequence', self._sequenceName)
+		elif command['command'] == 'stop':
+			self._startRequested = False
+			self._stopRequested = self._playing
+		elif command['command'] == 'seek':
+			if self._playing or self._startRequested:
+				self._seekPosition = command['position']
+			else:
+				logger.warning('ignoring seek, no sequence is playing')
+		elif command['command'] == 'profile':
+			if command.get('enabled', not self._profiler.isRunning()):
+				self._profiler.start()
+			else:
+				self._profiler.stop()
+		elif command['command'] == 'memory':
+			self._profiler.snapshotMemory()
+
+class PlaybackBenchmark:
+	def __init__(self, backend, characteristics, csvFileName, repetitions, renderRate, compressSequence):
+		self._backend = backend
+		self._characteristics = characteristics
+		self._csvFileName = csvFileName
+		self._repetitions = repetitions
+		self._renderRate = renderRate
+		self._compressSequence = compressSequence
+		self._wallTime = Histogram()
+		self._cpuTime = Histogram()
+		
+	def run(self):
+		with tempfile.TemporaryDirectory() as directory:
+			start = time.perf_counter()
+			if self._renderRate > 0:
+				fileName = os.path.join(directory, 'sequence.json')
+				sequence = KeyframeSequence.load(fileName, self._csvFileName, Falcon._iterationStepInMilliseconds, self._renderRate, self._characteristics)
+			else:
+				fileName = os.path.join(directory, 'sequence.bin')
+				sequence = Sequence.load(self._csvFileName, fileName, Falcon._iterationStepInMilliseconds, self._characteristics, self._compressSequence)
+			logger.info('benchmark: loaded sequence with ' + str(sequence.getDriveLedCount()) + ' drive leds in ' + '{:.3f}'.format(time.perf_counter() - start) + 's, ' + str(os.path.getsize(fileName)) + ' bytes on disk')
+			
+			# the drive is as long as the sequence, so larger models can be measured
+			with sequence, Peripherals(self._backend, EventQueue(), self._characteristics, [(0, sequence.getDriveLedCount())]) as peripherals:
+				start = time.perf_counter()
+				for i in range(self._repetitions):
+					self.__playTimed(sequence, peripherals)
+				duration = time.perf_counter() - start
+				peakMemory, retainedBlocks = self.__playTraced(sequence, peripherals)
+				peripherals.logOutputStatistics()
+		
+		frameCount = self._wallTime.getCount()
+		logger.info('benchmark: played ' + str(frameCount) + ' frames in ' + '{:.3f}'.format(duration) + 's, ' + '{:.1f}'.format(frameCount/duration) + ' frames/s')
+		logger.info('benchmark: wall time per frame ' + self._wallTime.describe())
+		logger.info('benchmark: cpu time per frame ' + self._cpuTime.describe())
+		logger.info('benchmark: peak traced memory during one playback ' + str(peakMemory) + ' bytes, ' + str(retainedBlocks) + ' memory blocks retained')
+		
+	def __playTimed(self, sequence, peripherals):
+		for step in range(sequence.getStepCount()):
+			wallStart = time.perf_counter_ns()
+			cpuStart = time.process_time_ns()
+			sequence.applyTo(peripherals, step)
+			self._cpuTime.add(time.process_time_ns() - cpuStart)
+			self._wallTime.add(time.perf_counter_ns() - wallStart)
+			
+	def __playTraced(self, sequence, peripherals):
+		tracemalloc.start()
+		before = tracemalloc.take_snapshot()
+		for step in range(sequence.getStepCount()):
+			sequence.applyTo(peripherals, step)
+		after = tracemalloc.take_snapshot()
+		peakMemory = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+		retainedBlocks = sum([x.count_diff for x in after.compare_to(before, 'lineno')])
+		return peakMemory, retainedBlocks
 
 if __name__ == '__main__':
-	signalHandler = SignalHandler()
+	parser = argparse.ArgumentParser(description='plays the light and sound sequence of the millenium falcon')
+	parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='level of the log messages')
+	parser.add_argument('--log-file', default=None, help='file the log messages are additionally written to')
+	parser.add_argument('--trace-capacity', type=int, default=0, help='number of events kept in the hot path trace buffer, 0 disables tracing')
+	parser.add_argument('--frame-policy', default=FrameScheduler.DROP, choices=FrameScheduler.policies, help='how the playback catches up after a frame missed its deadline')
+	parser.add_argument('--trace-file', default='/var/log/falcon-trace', help='file the trace buffer is dumped into on SIGUSR1')
+	parser.add_argument('--backend', default='hardware', choices=['hardware', 'simulated'], help='drive the real hardware or an in-memory simulation of it')
+	parser.add_argument('--simulated-latency', type=float, default=0, help='latency in milliseconds of each call into the simulated backend')
+	parser.add_argument('--benchmark', action='store_true', help='play a sequence as fast as possible, report the frame statistics and exit')
+	parser.add_argument('--benchmark-sequence', default='/usr/share/falcon/sequences/sequence.csv', help='sequence played by the benchmark')
+	parser.add_argument('--benchmark-repetitions', type=int, default=10, help='how often the benchmark plays the sequence')
+	parser.add_argument('--pwm-curve-base', type=float, nargs=4, default=[100, 100, 100, 100], metavar=('TURRET', 'COCKPIT', 'FRONT', 'LANDING_GEAR_AND_RAMP'), help='base of the exponential brightness curve of each pwm output')
+	parser.add_argument('--drive-gamma', type=float, nargs=3, default=[1, 1, 1], metavar=('RED', 'GREEN', 'BLUE'), help='gamma applied to each color channel of the drive on top of the gamma table of the ws281x library')
+	parser.add_argument('--clock', default='audio', choices=['audio', 'monotonic'], help='clock the sequence follows, either the position of the audio playback or the system clock')
+	parser.add_argument('--audio-latency', type=float, default=0, help='output latency in milliseconds between the mixer position and the audible sound')
+	parser.add_argument('--audio-clock-smoothing', type=float, default=0.1, help='weight of each new audio position when correcting the clock, between 0 and 1')
+	parser.add_argument('--audio-directory', default='/usr/share/falcon/audio', help='directory with the audio cues of the boot sequence and the default audio of the sequences')
+	parser.add_argument('--audio-cache-size', type=float, default=64, help='maximum size in megabytes of the audio cues kept in memory')
+	parser.add_argument('--audio-stream-threshold', type=float, default=4, help='size in megabytes above which an audio file is kept encoded and streamed instead of being decoded')
+	parser.add_argument('--no-render-thread', dest='render_thread', action='store_false', help='render the frames of a sequence on the main loop instead of a separate thread')
+	parser.add_argument('--drive-mode', default='sequence', choices=['sequence', 'audio'], help='whether the drive follows the sequence or reacts to the audio which is played')
+	parser.add_argument('--reactive-frame-rate', type=float, default=40, help='frames per second of the drive when it reacts to the audio')
+	parser.add_argument('--reactive-bands', type=int, default=16, help='number of frequency bands spread over the drive when it reacts to the audio')
+	parser.add_argument('--render-rate', type=float, default=0, help='frames per second at which the sequence is played from interpolated keyframes, 0 plays the steps of the sequence as they are')
+	parser.add_argument('--compress-sequence', action='store_true', help='store the sequence delta and run length encoded and decode each step while playing')
+	parser.add_argument('--library-directory', default='/usr/share/falcon/sequences', help='directory with the sequences and an optional manifest.json')
+	parser.add_argument('--cache-directory', default='/var/cache/falcon', help='directory in which the compiled sequences are kept')
+	parser.add_argument('--library-poll-interval', type=float, default=2, help='seconds between two checks of the sequence library for changes')
+	parser.add_argument('--led-count', type=int, default=39, help='number of leds of the drive on pwm channel 0, each sequence must have as many drive leds')
+	parser.add_argument('--control-socket', default='/var/run/falcon-service.sock', help='unix socket of the control server, an empty value disables it')
+	parser.add_argument('--control-port', type=int, default=0, help='localhost port of the control server, 0 disables it')
+	parser.add_argument('--metrics-port', type=int, default=0, help='port on which the metrics are served in the prometheus text format, 0 disables it')
+	parser.add_argument('--metrics-address', default='127.0.0.1', help='address the metrics server listens on')
+	parser.add_argument('--metrics-file', default=None, help='file the metrics are periodically written to in the prometheus text format, for example for the textfile collector of the node exporter')
+	parser.add_argument('--metrics-interval', type=float, default=10, help='seconds between two writes of the metrics file')
+	parser.add_argument('--profiler', default=Profiler.CPROFILE, choices=Profiler.modes, help='profile the main loop with cProfile into a pstats file or sample the stacks of all threads into a collapsed stacks file')
+	parser.add_argument('--profile-directory', default='/var/log', help='directory the profiles and memory snapshots are written to')
+	parser.add_argument('--profile-sampling-interval', type=float, default=5, help='milliseconds between two samples of the sampling profiler')
+	parser.add_argument('--profile-boot', action='store_true', help='profile the startup until the boot sequence is finished')
+	parser.add_argument('--drive-segments', nargs='+', default=None, metavar='CHANNEL:COUNT', help='split the drive into segments on both pwm channels instead, for example 0:39 1:120; the leds of all segments form one frame')
+	arguments = parser.parse_args()
+	
+	configureLogging(arguments.log_level, arguments.log_file)
+	timeline = StartupTimeline()
+	characteristics = OutputCharacteristics(arguments.pwm_curve_base, arguments.drive_gamma)
+	
+	if arguments.backend == 'simulated':
+		backend = SimulatedBackend(arguments.simulated_latency/1000)
+	else:
+		backend = timeline.measure('backend', HardwareBackend)
+	
+	if arguments.benchmark:
+		PlaybackBenchmark(backend, characteristics, arguments.benchmark_sequence, arguments.benchmark_repetitions, arguments.render_rate, arguments.compress_sequence).run()
+		sys.exit(0)
+	
+	logger.debug("set process name")
+	setprocessname(b"falcon-service")
 	
-	with Falcon(signalHandler) as falcon:
+	trace = TraceBuffer(arguments.trace_capacity) if arguments.trace_capacity > 0 else DisabledTraceBuffer()
+	events = EventQueue()
+	signalHandler = SignalHandler(events, trace, arguments.trace_file)
+	
+	if arguments.clock == 'audio':
+		clock = AudioClock(arguments.audio_latency, arguments.audio_clock_smoothing)
+	else:
+		clock = MonotonicClock()
+	
+	if arguments.drive_segments is None:
+		driveSegments = [(0, arguments.led_count)]
+	else:
+		driveSegments = [tuple([int(y) for y in x.split(':')]) for x in arguments.drive_segments]
+	
+	library = SequenceLibrary(arguments.library_directory, arguments.cache_directory, Falcon._iterationStepInMilliseconds, characteristics, arguments.render_rate, arguments.compress_sequence, arguments.audio_directory)
+	
+	if arguments.control_socket or arguments.control_port > 0:
+		control = ControlServer(events, arguments.control_socket, arguments.control_port)
+	else:
+		control = DisabledControlServer()
+	
+	metrics = Metrics()
+	profiler = Profiler(arguments.profiler, arguments.profile_directory, arguments.profile_sampling_interval/1000)
+	if arguments.profile_boot:
+		profiler.start()
+	
+	with MetricsExporter(metrics, arguments.metrics_address, arguments.metrics_port, arguments.metrics_file, arguments.metrics_interval), SequenceLibraryWatcher(library, events, arguments.library_poll_interval), control, Falcon(
+			backend=backend,
+			events=events,
+			signalHandler=signalHandler,
+			trace=trace,
+			framePolicy=arguments.frame_policy,
+			characteristics=characteristics,
+			clock=clock,
+			audioCacheSizeInBytes=int(arguments.audio_cache_size*1024*1024),
+			audioStreamThresholdInBytes=int(arguments.audio_stream_threshold*1024*1024),
+			audioDirectory=arguments.audio_directory,
+			timeline=timeline,
+			renderThread=arguments.render_thread,
+			driveMode=arguments.drive_mode,
+			reactiveFrameRate=arguments.reactive_frame_rate,
+			reactiveBandCount=arguments.reactive_bands,
+			library=library,
+			driveSegments=driveSegments,
+			control=control,
+			metrics=metrics,
+			profiler=profiler) as falcon:
 		falcon.bootSequence()
+		if arguments.profile_boot:
+			profiler.stop()
 		
 		while not signalHandler.checkIfShouldBeStopped():
 			falcon.runOnce()
-			time.sleep(0.2)
+			falcon.waitForEvent()
+		
+		profiler.stop()
 
-	logger.info("stopping gracefully")
\ No newline at end of file
+	logger.info("stopping gracefully")
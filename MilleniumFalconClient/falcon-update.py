@@ -2,12 +2,14 @@
 
 from subprocess import call,check_call
 from shutil import copyfile
+from os import makedirs
 
 sourcePath = "/usr/src/milleniumfalcon"
 falconUpdate = "/usr/bin/falcon-update.py"
 falconService = "/usr/bin/falcon-service.py"
 falconServiceInitScript = "/etc/init.d/falcon-service"
 falconServiceLogFile = "/var/log/falcon-service"
+falconServiceCacheDirectory = "/var/cache/falcon"
 
 print("checkout repository")
 check_call(["git", "fetch", "--force"], cwd=sourcePath)
@@ -51,6 +53,11 @@ copyfile(sourcePath + "/MilleniumFalconClient/audio/bootup_sequence_initialized.
 copyfile(sourcePath + "/MilleniumFalconClient/audio/bootup_sequence_finished.wav", "/usr/share/falcon/audio/bootup_sequence_finished.wav")
 copyfile(sourcePath + "/MilleniumFalconClient/audio/take_off.wav", "/usr/share/falcon/audio/take_off.wav")
 
+print("create sequence library and cache if necessary")
+makedirs("/usr/share/falcon/sequences", exist_ok=True)
+makedirs(falconServiceCacheDirectory, exist_ok=True)
+call(["chown", "falcon-service", falconServiceCacheDirectory])
+
 print("copy sequence")
-copyfile(sourcePath + "/MilleniumFalconClient/sequence.csv", "/usr/share/falcon/sequence.csv")
+copyfile(sourcePath + "/MilleniumFalconClient/sequence.csv", "/usr/share/falcon/sequences/sequence.csv")
 
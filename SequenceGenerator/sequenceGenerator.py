@@ -1,126 +1,297 @@
 from scipy.io import wavfile
-import scipy as sp
-import matplotlib.pylab as plt
+from scipy import signal
 import numpy
-import random
+import argparse
+import concurrent.futures
+import hashlib
+import io
+import json
+import os
 
-random.seed(42)
+# part of the cache key, increase it whenever the generated frames change for the same input
+generatorVersion = 1
+cutOffFrequency = 50000
+driveCutOffFrequency = 50000
+driveCutOffFrequencyInHz = 400
+driveFilterOrder = 4
+streamingBlockSteps = 50
+cacheFileName = '.sequence-cache.json'
+defaultStyle = {'name': 'default', 'driveLength': 39, 'driveColor': [200, 255, 255], 'driveColorBad': [255, 0, 0], 'seed': 42}
+
+def combineChannels(data):
+	leftAndRightCombined = data.astype(numpy.float64)
+	if leftAndRightCombined.ndim > 1:
+		leftAndRightCombined = leftAndRightCombined.mean(axis=1)
+	return leftAndRightCombined
+
+def getIterationSteps(dataPoints, samplingRate, iterationStepLengthInMs):
+	return int(dataPoints/samplingRate*(1000/iterationStepLengthInMs)) - 1
+
+def getSteps(firstStep, lastStep, samplingRate, iterationStepLengthInMs):
+	stepStartTimes = numpy.arange(firstStep, lastStep + 1) * iterationStepLengthInMs / 1000
+	stepBoundaries = (stepStartTimes * samplingRate).astype(numpy.int64)
+	return stepStartTimes[:-1], stepBoundaries
 
-print('read in source file')
-samplingRate, data = wavfile.read('../MilleniumFalconClient/audio/take_off.wav')
-dataPoints = len(data)
-leftAndRightCombined = [None] * dataPoints
+def getStepMeans(values, stepBoundaries):
+	# the mean of each iteration step is the sum over its window divided by the window length
+	localBoundaries = stepBoundaries - stepBoundaries[0]
+	absoluteValues = numpy.abs(values[:localBoundaries[-1]])
+	return numpy.add.reduceat(absoluteValues, localBoundaries[:-1]) / numpy.diff(localBoundaries)
 
-print('combine left and right into one channel')
-for i in range(dataPoints):
-	leftAndRightCombined[i] = (float(data[i][0]) + float(data[i][1]))/2
+def analyzeInMemory(fileName, iterationStepLengthInMs, plot):
+	samplingRate, data = wavfile.read(fileName)
+	dataPoints = len(data)
 	
-maximumValue = max(leftAndRightCombined)
-leftAndRightCombined = [value/maximumValue for value in leftAndRightCombined]
-timeValues = [float(timeValue) / samplingRate for timeValue in list(range(dataPoints))]
+	leftAndRightCombined = combineChannels(data)
+	maximumValue = leftAndRightCombined.max()
+	leftAndRightCombined /= maximumValue
+	
+	frequencies = numpy.real(numpy.fft.rfft(leftAndRightCombined))
+	driveFrequencies = frequencies.copy()
+	driveFrequencies[driveCutOffFrequency:] = 0
+	driveValues = numpy.fft.irfft(driveFrequencies)
+	
+	plotImage = None
+	if plot:
+		plotImage = createPlot(leftAndRightCombined, frequencies, driveValues, samplingRate)
+	
+	stepStartTimes, stepBoundaries = getSteps(0, getIterationSteps(dataPoints, samplingRate, iterationStepLengthInMs), samplingRate, iterationStepLengthInMs)
+	return stepStartTimes, getStepMeans(driveValues, stepBoundaries), plotImage
 
-print('execute frequency analysis')
-frequencies = [numpy.real(value) for value in numpy.fft.rfft(leftAndRightCombined)]
-cutOffFrequency = 50000
-driveCutOffFrequency = 50000
-driveFrequencies = frequencies.copy()
-for i in range(driveCutOffFrequency, len(driveFrequencies)):
-	driveFrequencies[i] = 0
-driveValues = numpy.fft.irfft(driveFrequencies)
-
-print('create plots')
-plt.subplot(2, 2, 1)
-plt.plot(timeValues, leftAndRightCombined)
-plt.subplot(2, 2, 3)
-plt.plot(list(range(cutOffFrequency)), frequencies[:cutOffFrequency])
-plt.subplot(2, 2, 2)
-plt.plot(timeValues, driveValues)
-plt.show()
-
-print('create output files')
-wavfile.write('C:/Temp/drive.wav', samplingRate, driveValues)
-iterationStepLengthInMs = 200
-sequenceFile = open('../MilleniumFalconClient/sequence.csv', 'w')
-iterationSteps = int(dataPoints/samplingRate*(1000/iterationStepLengthInMs)) - 1
-driveValuesNormalized = [None] * iterationSteps
-driveColorRed = 200
-driveColorGreen = 255
-driveColorBlue = 255
-driveColorRedBad = 255
-driveColorGreenBad = 0
-driveColorBlueBad = 0
-driveLength = 39
-
-for i in range(iterationSteps):
-	start = i * iterationStepLengthInMs / 1000
-	end = (i + 1) * iterationStepLengthInMs / 1000
-	driveValue = numpy.mean([abs(x) for x in driveValues[int(start*samplingRate):int(end*samplingRate)]])
-	
-	if start > 20:
-		driveValue = 1
-	
-	driveValuePerLed = [None] * driveLength
-	
-	for j in range(driveLength):
-		driveValueRandomized = driveValue
-		if start <= 20:
-			driveValueRandomized = driveValueRandomized + random.randrange(-50, 30)/1000
-			driveValueRandomized = max(0, driveValueRandomized)
-			driveValueRandomized = min(1, driveValueRandomized)
+def createPlot(leftAndRightCombined, frequencies, driveValues, samplingRate):
+	# the plots are rendered into a png, so the generator also runs without a display
+	import matplotlib
+	matplotlib.use('Agg')
+	import matplotlib.pylab as plt
+	
+	timeValues = numpy.arange(len(leftAndRightCombined)) / samplingRate
+	plt.figure()
+	plt.subplot(2, 2, 1)
+	plt.plot(timeValues, leftAndRightCombined)
+	plt.subplot(2, 2, 3)
+	plt.plot(numpy.arange(cutOffFrequency), frequencies[:cutOffFrequency])
+	plt.subplot(2, 2, 2)
+	plt.plot(timeValues[:len(driveValues)], driveValues)
+	plotImage = io.BytesIO()
+	plt.savefig(plotImage, format='png')
+	plt.close()
+	return plotImage.getvalue()
+
+def analyzeStreaming(fileName, iterationStepLengthInMs):
+	samplingRate, data = wavfile.read(fileName, mmap=True)
+	dataPoints = len(data)
+	blockSamples = int(streamingBlockSteps * iterationStepLengthInMs / 1000 * samplingRate)
+	maximumValue = max([combineChannels(data[i:i + blockSamples]).max() for i in range(0, dataPoints, blockSamples)])
+	
+	driveFilter = signal.butter(driveFilterOrder, driveCutOffFrequencyInHz, btype='lowpass', fs=samplingRate, output='sos')
+	driveFilterState = numpy.zeros((driveFilter.shape[0], 2))
+	iterationSteps = getIterationSteps(dataPoints, samplingRate, iterationStepLengthInMs)
+	
+	for firstStep in range(0, iterationSteps, streamingBlockSteps):
+		lastStep = min(firstStep + streamingBlockSteps, iterationSteps)
+		stepStartTimes, stepBoundaries = getSteps(firstStep, lastStep, samplingRate, iterationStepLengthInMs)
+		leftAndRightCombined = combineChannels(data[stepBoundaries[0]:stepBoundaries[-1]]) / maximumValue
+		driveValues, driveFilterState = signal.sosfilt(driveFilter, leftAndRightCombined, zi=driveFilterState)
+		yield stepStartTimes, getStepMeans(driveValues, stepBoundaries)
+
+class FrameSynthesizer:
+	def __init__(self, style, temporaryFileName):
+		self._driveLength = style['driveLength']
+		self._driveColor = numpy.array(style['driveColor'])
+		self._driveColorBad = numpy.array(style['driveColorBad'])
+		# separate generators keep the random values independent of the block size of the streaming analysis
+		self._randomJitter, self._randomBadValues = [numpy.random.default_rng(seed) for seed in numpy.random.SeedSequence(style['seed']).spawn(2)]
+		# the frames are streamed into a temporary file next to the output, so memory stays
+		# constant and the output is only replaced once all sequences are generated
+		self._output = open(temporaryFileName, 'w')
+		self.__writeHeader()
+		
+	def randomizeDriveValues(self, stepStartTimes, driveValuePerStep):
+		driveValuePerStep = driveValuePerStep.copy()
+		driveValuePerStep[stepStartTimes > 20] = 1
+		driveJitter = self._randomJitter.integers(-50, 30, size=(len(stepStartTimes), self._driveLength)) / 1000
+		driveJitter[stepStartTimes > 20] = 0
+		return numpy.clip(driveValuePerStep[:, numpy.newaxis] + driveJitter, 0, 1)
+		
+	def writeFrames(self, stepStartTimes, driveValuesNormalized):
+		iterationSteps = len(stepStartTimes)
+		turretValues = numpy.full(iterationSteps, 255)
+		cockpitValues = numpy.full(iterationSteps, 255)
+		frontValues = numpy.full(iterationSteps, 150)
+		landingGearAndRampValues = numpy.full(iterationSteps, 255)
+		
+		secondsFromErrorStart = stepStartTimes - 54
+		errorActive = (stepStartTimes > 54) & (stepStartTimes < 60 + 18)
+		cockpitValues[errorActive & (secondsFromErrorStart - numpy.trunc(secondsFromErrorStart) > 0.5)] = 0
+		frontValues[stepStartTimes > 60 + 55] = 255
 		
-		driveValuePerLed[j] = driveValueRandomized
+		useBadValue = self._randomBadValues.integers(0, 200, size=(iterationSteps, self._driveLength)) < 1
+		useBadValue[stepStartTimes > 60 + 55] = False
+		driveColors = numpy.where(useBadValue[:, :, numpy.newaxis], self._driveColorBad, self._driveColor)
+		driveChannelValues = (driveValuesNormalized[:, :, numpy.newaxis] * driveColors).astype(numpy.int64)
+		
+		frames = numpy.column_stack([turretValues, cockpitValues, frontValues, landingGearAndRampValues, driveChannelValues.reshape(iterationSteps, 3 * self._driveLength)])
+		numpy.savetxt(self._output, frames, fmt='%d', delimiter=';')
+		
+	def close(self):
+		self._output.close()
+		return self._output.name
+		
+	def discard(self):
+		self._output.close()
+		os.unlink(self._output.name)
+		
+	def __writeHeader(self):
+		header = ['turret', 'cockpit', 'front', 'landingGearAndRamp']
+		
+		for i in range(self._driveLength):
+			header += ['drive-red-' + str(i), 'drive-green-' + str(i), 'drive-blue-' + str(i)]
+		
+		self._output.write(';'.join(header) + '\n')
+
+def generateSequences(sourceFileName, styles, temporaryFileNames, iterationStepLengthInMs, streaming, plot):
+	synthesizers = []
+	try:
+		for style, temporaryFileName in zip(styles, temporaryFileNames):
+			synthesizers.append(FrameSynthesizer(style, temporaryFileName))
+		plotImage = synthesizeFrames(sourceFileName, synthesizers, iterationStepLengthInMs, streaming, plot)
+	except BaseException:
+		for synthesizer in synthesizers:
+			synthesizer.discard()
+		raise
 	
-	driveValuesNormalized[i] = driveValuePerLed
+	return [synthesizer.close() for synthesizer in synthesizers], plotImage
 
-maximumDriveValue = max(max(driveValuesNormalized))
+def synthesizeFrames(sourceFileName, synthesizers, iterationStepLengthInMs, streaming, plot):
+	plotImage = None
+	
+	if streaming:
+		# the drive values are clipped to 1 and reach it after 20s, so each block is synthesized as soon as it is analyzed
+		for stepStartTimes, driveValuePerStep in analyzeStreaming(sourceFileName, iterationStepLengthInMs):
+			for synthesizer in synthesizers:
+				synthesizer.writeFrames(stepStartTimes, synthesizer.randomizeDriveValues(stepStartTimes, driveValuePerStep))
+	else:
+		stepStartTimes, driveValuePerStep, plotImage = analyzeInMemory(sourceFileName, iterationStepLengthInMs, plot)
+		for synthesizer in synthesizers:
+			driveValuesNormalized = synthesizer.randomizeDriveValues(stepStartTimes, driveValuePerStep)
+			driveValuesNormalized /= driveValuesNormalized.max()
+			synthesizer.writeFrames(stepStartTimes, driveValuesNormalized)
+	
+	return plotImage
 
-sequenceFile.write('turret;cockpit;front;landingGearAndRamp')
+def getTemporaryFileName(outputFileName):
+	return os.path.join(os.path.dirname(outputFileName), '.' + os.path.basename(outputFileName) + '.' + str(os.getpid()) + '.tmp')
 
-for i in range(driveLength):
-	sequenceFile.write('drive-red-' + str(i) + ';')
-	sequenceFile.write('drive-green-' + str(i) + ';')
-	sequenceFile.write('drive-blue-' + str(i) + ';')
+def removeFiles(fileNames):
+	for fileName in fileNames:
+		try:
+			os.unlink(fileName)
+		except FileNotFoundError:
+			pass
 
-sequenceFile.write('\n')
+def hashFile(fileName):
+	fileHash = hashlib.sha256()
+	with open(fileName, 'rb') as hashedFile:
+		for block in iter(lambda: hashedFile.read(1 << 20), b''):
+			fileHash.update(block)
+	return fileHash.hexdigest()
 
-for i in range(iterationSteps):
-	start = i * iterationStepLengthInMs / 1000
-	turretValue = 255
-	cockpitValue = 255
-	frontValue = 150
-	landingGearAndRampValue = 255
+def getCacheKey(sourceHash, style, arguments):
+	parameters = {'source': sourceHash, 'style': style, 'stepLength': arguments.step_length, 'streaming': arguments.streaming, 'version': generatorVersion}
+	return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()
+
+def loadStyles(fileName):
+	if fileName is None:
+		return [defaultStyle]
 	
-	if start > 54 and start < 60 + 18:
-		startFromErrorStart = start - 54
-		withouFullSeconds = startFromErrorStart - int(startFromErrorStart)
-		if withouFullSeconds > 0.5:
-			cockpitValue = 0
+	with open(fileName, 'r') as styleFile:
+		styles = json.load(styleFile)
 	
-	if start > 60 + 55:
-		frontValue = 255
+	return [dict(defaultStyle, **style) for style in styles]
+
+def loadCache(outputDirectory):
+	try:
+		with open(os.path.join(outputDirectory, cacheFileName), 'r') as cacheFile:
+			return json.load(cacheFile)
+	except (OSError, ValueError):
+		return {}
+
+def main():
+	parser = argparse.ArgumentParser(description='generates light sequences for a library of soundtracks')
+	parser.add_argument('sources', nargs='+', help='wav files to generate sequences for')
+	parser.add_argument('--styles', default=None, help='json file with a list of styles, each with name, driveLength, driveColor, driveColorBad and seed')
+	parser.add_argument('--output-directory', default='.', help='directory the sequences are written to')
+	parser.add_argument('--output-pattern', default='{track}-{style}.csv', help='file name of each sequence, {track} and {style} are replaced')
+	parser.add_argument('--step-length', type=int, default=200, help='length of one iteration step in milliseconds')
+	parser.add_argument('--streaming', action='store_true', help='analyze the soundtracks block by block with constant memory')
+	parser.add_argument('--plot', action='store_true', help='write a png with the analysis of each soundtrack, not available with --streaming')
+	parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='number of soundtracks processed in parallel')
+	parser.add_argument('--force', action='store_true', help='regenerate sequences even if their input did not change')
+	arguments = parser.parse_args()
 	
-	sequenceFile.write(str(turretValue) + ';')
-	sequenceFile.write(str(cockpitValue) + ';')
-	sequenceFile.write(str(frontValue) + ';')
-	sequenceFile.write(str(landingGearAndRampValue) + ';')
+	styles = loadStyles(arguments.styles)
+	cache = loadCache(arguments.output_directory)
+	jobs = []
+	outputFileNames = set()
 	
-	for j in range(driveLength):
-		driveValue = driveValuesNormalized[i][j] / maximumDriveValue
-		redChannel = driveColorRed
-		greenChannel = driveColorGreen
-		blueChannel = driveColorBlue
+	for sourceFileName in arguments.sources:
+		sourceHash = hashFile(sourceFileName)
+		track = os.path.splitext(os.path.basename(sourceFileName))[0]
+		pendingStyles = []
 		
-		useBadValue = random.randrange(0, 200) < 1
-		if start <= 60 + 55 and useBadValue:
-			redChannel = driveColorRedBad
-			greenChannel = driveColorGreenBad
-			blueChannel = driveColorBlueBad
+		for style in styles:
+			outputFileName = arguments.output_pattern.format(track=track, style=style['name'])
+			if outputFileName in outputFileNames:
+				parser.error('the output pattern creates ' + outputFileName + ' more than once')
+			outputFileNames.add(outputFileName)
+			
+			cacheKey = getCacheKey(sourceHash, style, arguments)
+			if not arguments.force and cache.get(outputFileName) == cacheKey and os.path.exists(os.path.join(arguments.output_directory, outputFileName)):
+				print('skipping unchanged ' + outputFileName)
+				continue
+			pendingStyles.append((style, outputFileName, cacheKey))
 		
-		valueRed = driveValue * redChannel
-		valueGreen = driveValue * greenChannel
-		valueBlue = driveValue * blueChannel
+		if len(pendingStyles) > 0:
+			jobs.append((sourceFileName, track, pendingStyles))
+	
+	results = []
+	temporaryFileNames = []
+	os.makedirs(arguments.output_directory, exist_ok=True)
+	
+	with concurrent.futures.ProcessPoolExecutor(max_workers=arguments.jobs) as executor:
+		try:
+			futures = {}
+			for sourceFileName, track, pendingStyles in jobs:
+				jobFileNames = [getTemporaryFileName(os.path.join(arguments.output_directory, x[1])) for x in pendingStyles]
+				temporaryFileNames += jobFileNames
+				future = executor.submit(generateSequences, sourceFileName, [x[0] for x in pendingStyles], jobFileNames, arguments.step_length, arguments.streaming, arguments.plot and not arguments.streaming)
+				futures[future] = (track, pendingStyles)
+			
+			for future in concurrent.futures.as_completed(futures):
+				track, pendingStyles = futures[future]
+				sequences, plotImage = future.result()
+				print('generated ' + str(len(sequences)) + ' sequences for ' + track)
+				results.append((track, pendingStyles, sequences, plotImage))
+		except BaseException:
+			# no output is replaced if any soundtrack fails, the soundtracks which are still
+			# generated are finished first so none of their files is left behind
+			executor.shutdown(wait=True, cancel_futures=True)
+			removeFiles(temporaryFileNames)
+			raise
+	
+	for track, pendingStyles, sequences, plotImage in results:
+		for (style, outputFileName, cacheKey), temporaryFileName in zip(pendingStyles, sequences):
+			os.replace(temporaryFileName, os.path.join(arguments.output_directory, outputFileName))
+			cache[outputFileName] = cacheKey
 		
-		sequenceFile.write(str(int(valueRed)) + ';' + str(int(valueGreen)) + ';' + str(int(valueBlue)) + ';')
-	sequenceFile.write('\n')
+		if plotImage is not None:
+			with open(os.path.join(arguments.output_directory, track + '-analysis.png'), 'wb') as plotFile:
+				plotFile.write(plotImage)
+	
+	with open(os.path.join(arguments.output_directory, cacheFileName), 'w') as cacheFile:
+		json.dump(cache, cacheFile, indent='\t', sort_keys=True)
+	
+	print('wrote ' + str(sum([len(x[2]) for x in results])) + ' sequences')
 
-sequenceFile.close()
\ No newline at end of file
+if __name__ == '__main__':
+	main()
@@ -1,8 +1,15 @@
 # Adafruit NeoPixel library port to the rpi_ws281x library.
 # Author: Tony DiCola (tony@tonydicola.com), Jeremy Garff (jer@jers.net)
+import array
+
 import _rpi_ws281x as ws
 
 
+# Array type code and size matching the native 32-bit ws2811_led_t.
+_LED_TYPECODE = 'I'
+_LED_SIZE = 4
+
+
 def Color(red, green, blue):
 	"""Convert the provided red, green, blue color to a 24-bit color value.
 	Each color component should be a value 0-255 where 0 is the lowest intensity
@@ -26,7 +33,11 @@ class _LED_Data(object):
 		# Handle if a slice of positions are passed in by grabbing all the values
 		# and returning them in a list.
 		if isinstance(pos, slice):
-			return [ws.ws2811_led_get(self.channel, n) for n in range(pos.indices(self.size))]
+			start, stop, step = pos.indices(self.size)
+			# Contiguous slices are read with a single copy out of the channel.
+			if step == 1:
+				return self.getBuffer(start, max(stop - start, 0)).tolist()
+			return [ws.ws2811_led_get(self.channel, n) for n in range(start, stop, step)]
 		# Else assume the passed in value is a number to the position.
 		else:
 			return ws.ws2811_led_get(self.channel, pos)
@@ -38,14 +49,71 @@ class _LED_Data(object):
 		# Handle if a slice of positions are passed in by setting the appropriate
 		# LED data values to the provided values.
 		if isinstance(pos, slice):
+			start, stop, step = pos.indices(self.size)
+			# Contiguous slices are written with a single copy into the channel.
+			# Only buffers of native 32-bit unsigned words are copied as they are,
+			# anything else is converted value by value so the copy can neither
+			# spill over the end of the slice nor reinterpret the bytes.
+			if step == 1:
+				count = max(stop - start, 0)
+				try:
+					data = memoryview(value)
+				except TypeError:
+					data = None
+				if data is None or data.itemsize != _LED_SIZE or data.format.lstrip('@=') not in ('I', 'L'):
+					data = memoryview(array.array(_LED_TYPECODE, value if data is None else data.tolist()))
+				if data.nbytes != _LED_SIZE * count:
+					raise ValueError('{0} colors cannot be assigned to a slice of {1} LEDs'.format(data.nbytes // _LED_SIZE, count))
+				self.setBuffer(start, data)
+				return
 			index = 0
-			for n in range(pos.indices(self.size)):
+			for n in range(start, stop, step):
 				ws.ws2811_led_set(self.channel, n, value[index])
 				index += 1
 		# Else assume the passed in value is a number to the position.
 		else:
 			return ws.ws2811_led_set(self.channel, pos, value)
 
+	def setBuffer(self, offset, buffer):
+		"""Copy the 24-bit RGB color values in buffer into the LED data starting
+		at position offset with a single native call.  The buffer can be any
+		object supporting the buffer protocol which holds native 32-bit words,
+		like an array('I') or a memoryview of one, otherwise it is converted
+		into an array first.
+		"""
+		try:
+			data = memoryview(buffer)
+		except TypeError:
+			data = memoryview(array.array(_LED_TYPECODE, buffer))
+		if data.nbytes % _LED_SIZE != 0:
+			raise ValueError('the buffer must contain whole 32-bit color values')
+		if ws.ws2811_led_set_buffer(self.channel, offset, data) != 0:
+			raise IndexError('{0} colors at position {1} do not fit into {2} LEDs'.format(data.nbytes // _LED_SIZE, offset, self.size))
+
+	def getBuffer(self, offset=0, count=None):
+		"""Return count 24-bit RGB color values starting at position offset as
+		an array('I'), copied out of the LED data with a single native call.
+		"""
+		if count is None:
+			count = self.size - offset
+		data = array.array(_LED_TYPECODE)
+		data.frombytes(ws.ws2811_led_get_buffer(self.channel, offset, count))
+		return data
+
+
+def _init_channels(leds, channels):
+	"""Configure both channels of the provided ws2811_t structure.  Channels
+	maps a channel number to a tuple of the number of pixels, the GPIO pin,
+	invert and brightness; all other channels are cleared.
+	"""
+	for channum in range(2):
+		chan = ws.ws2811_channel_get(leds, channum)
+		num, pin, invert, brightness = channels.get(channum, (0, 0, False, 0))
+		ws.ws2811_channel_t_count_set(chan, num)
+		ws.ws2811_channel_t_gpionum_set(chan, pin)
+		ws.ws2811_channel_t_invert_set(chan, 0 if not invert else 1)
+		ws.ws2811_channel_t_brightness_set(chan, brightness)
+
 
 class Adafruit_NeoPixel(object):
 	def __init__(self, num, pin, freq_hz=800000, dma=5, invert=False, brightness=255, channel=0):
@@ -60,20 +128,9 @@ class Adafruit_NeoPixel(object):
 		# Create ws2811_t structure and fill in parameters.
 		self._leds = ws.new_ws2811_t()
 
-		# Initialize the channels to zero
-		for channum in range(2):
-			chan = ws.ws2811_channel_get(self._leds, channum)
-			ws.ws2811_channel_t_count_set(chan, 0)
-			ws.ws2811_channel_t_gpionum_set(chan, 0)
-			ws.ws2811_channel_t_invert_set(chan, 0)
-			ws.ws2811_channel_t_brightness_set(chan, 0)
-
-		# Initialize the channel in use
+		# Initialize the channel in use and clear the other one
+		_init_channels(self._leds, {channel: (num, pin, invert, brightness)})
 		self._channel = ws.ws2811_channel_get(self._leds, channel)
-		ws.ws2811_channel_t_count_set(self._channel, num)
-		ws.ws2811_channel_t_gpionum_set(self._channel, pin)
-		ws.ws2811_channel_t_invert_set(self._channel, 0 if not invert else 1)
-		ws.ws2811_channel_t_brightness_set(self._channel, brightness)
 
 		# Initialize the controller
 		ws.ws2811_t_freq_set(self._leds, freq_hz)
@@ -136,3 +193,111 @@ class Adafruit_NeoPixel(object):
 	def getPixelColor(self, n):
 		"""Get the 24-bit RGB color value for the LED at position n."""
 		return self._led_data[n]
+
+	def setPixels(self, buffer, offset=0):
+		"""Set all LEDs starting at position offset to the 24-bit color values
+		in buffer with a single native copy.  The buffer should be an object
+		supporting the buffer protocol with native 32-bit words, for example
+		array('I'), bytes or a memoryview; any other sequence of integers is
+		converted first.
+		"""
+		self._led_data.setBuffer(offset, buffer)
+
+	def getPixelBuffer(self):
+		"""Return the 24-bit color values of all LEDs as an array('I'), copied
+		with a single native call.
+		"""
+		return self._led_data.getBuffer()
+
+
+class Adafruit_NeoPixel_MultiChannel(object):
+	def __init__(self, channels, freq_hz=800000, dma=5):
+		"""Class to represent the LED strips on both PWM channels of a single
+		controller, which are updated together with one render call.  Channels
+		is a list with an entry per PWM channel, either None for an unused
+		channel or a tuple of the number of pixels, the GPIO pin (a PWM0 pin like
+		18 for channel 0 and a PWM1 pin like 13 for channel 1), a boolean
+		specifying if the signal line should be inverted and the brightness.
+		Optional parameters are freq, the frequency of the display signal in
+		hertz (default 800khz) and dma, the DMA channel to use (default 5).
+		"""
+		if len(channels) > 2:
+			raise ValueError('the controller has only two PWM channels')
+		configured = dict((n, c) for n, c in enumerate(channels) if c is not None)
+
+		# Create ws2811_t structure and fill in parameters.
+		self._leds = ws.new_ws2811_t()
+		_init_channels(self._leds, configured)
+		ws.ws2811_t_freq_set(self._leds, freq_hz)
+		ws.ws2811_t_dmanum_set(self._leds, dma)
+
+		# Grab the led data array of every channel, unused channels have none.
+		self._channels = [ws.ws2811_channel_get(self._leds, n) for n in range(2)]
+		self._led_data = [_LED_Data(self._channels[n], configured[n][0]) if n in configured else None for n in range(2)]
+
+	def __del__(self):
+		# Clean up memory used by the library when not needed anymore.
+		if self._leds is not None:
+			ws.ws2811_fini(self._leds)
+			ws.delete_ws2811_t(self._leds)
+			self._leds = None
+			self._channels = None
+
+	def begin(self):
+		"""Initialize library, must be called once before other functions are
+		called.
+		"""
+		resp = ws.ws2811_init(self._leds)
+		if resp != 0:
+			raise RuntimeError('ws2811_init failed with code {0}'.format(resp))
+
+	def show(self):
+		"""Update the strips of all channels with the data from their LED buffers
+		with a single render call.
+		"""
+		resp = ws.ws2811_render(self._leds)
+		if resp != 0:
+			raise RuntimeError('ws2811_render failed with code {0}'.format(resp))
+
+	def setPixelColor(self, channel, n, color):
+		"""Set LED at position n of the provided channel to the 24-bit color
+		value (in RGB order).
+		"""
+		self.getPixels(channel)[n] = color
+
+	def setBrightness(self, channel, brightness):
+		"""Scale each LED of the provided channel by the brightness.  A brightness
+		of 0 is the darkest and 255 is the brightest.
+		"""
+		ws.ws2811_channel_t_brightness_set(self._channels[channel], brightness)
+
+	def getPixels(self, channel):
+		"""Return an object which allows access to the LED data of the provided
+		channel as if it were a sequence of 24-bit RGB values.
+		"""
+		if self._led_data[channel] is None:
+			raise ValueError('channel {0} is not in use'.format(channel))
+		return self._led_data[channel]
+
+	def numPixels(self, channel):
+		"""Return the number of pixels on the provided channel."""
+		return ws.ws2811_channel_t_count_get(self._channels[channel])
+
+	def getPixelColor(self, channel, n):
+		"""Get the 24-bit RGB color value for the LED at position n of the
+		provided channel.
+		"""
+		return self.getPixels(channel)[n]
+
+	def setPixels(self, channel, buffer, offset=0):
+		"""Set the LEDs of the provided channel starting at position offset to
+		the 24-bit color values in buffer with a single native copy, see
+		Adafruit_NeoPixel.setPixels.
+		"""
+		self.getPixels(channel).setBuffer(offset, buffer)
+
+	def getPixelBuffer(self, channel):
+		"""Return the 24-bit color values of all LEDs of the provided channel as
+		an array('I'), copied with a single native call.
+		"""
+		return self.getPixels(channel).getBuffer()
@@ -3225,6 +3225,30 @@ SWIGINTERNINLINE PyObject*
         return &ws->channel[channelnum];
     }
 
+    int ws2811_led_set_buffer(ws2811_channel_t *channel, int offset, const void *buffer, size_t ledcount)
+    {
+        if (!channel->leds || offset < 0 || offset + ledcount > (size_t)channel->count)
+        {
+            return -1;
+        }
+
+        memcpy(&channel->leds[offset], buffer, ledcount * sizeof(ws2811_led_t));
+
+        return 0;
+    }
+
+    int ws2811_led_get_buffer(ws2811_channel_t *channel, int offset, void *buffer, size_t ledcount)
+    {
+        if (!channel->leds || offset < 0 || offset + ledcount > (size_t)channel->count)
+        {
+            return -1;
+        }
+
+        memcpy(buffer, &channel->leds[offset], ledcount * sizeof(ws2811_led_t));
+
+        return 0;
+    }
+
 #ifdef __cplusplus
 extern "C" {
 #endif
@@ -3842,7 +3866,10 @@ SWIGINTERN PyObject *_wrap_ws2811_render(PyObject *SWIGUNUSEDPARM(self), PyObjec
     SWIG_exception_fail(SWIG_ArgError(res1), "in method '" "ws2811_render" "', argument " "1"" of type '" "ws2811_t *""'"); 
   }
   arg1 = (ws2811_t *)(argp1);
+  /* the call blocks until the dma transfer is finished, other threads may run meanwhile */
+  Py_BEGIN_ALLOW_THREADS
   result = (int)ws2811_render(arg1);
+  Py_END_ALLOW_THREADS
   resultobj = SWIG_From_int((int)(result));
   return resultobj;
 fail:
@@ -3864,7 +3891,10 @@ SWIGINTERN PyObject *_wrap_ws2811_wait(PyObject *SWIGUNUSEDPARM(self), PyObject
     SWIG_exception_fail(SWIG_ArgError(res1), "in method '" "ws2811_wait" "', argument " "1"" of type '" "ws2811_t *""'"); 
   }
   arg1 = (ws2811_t *)(argp1);
+  /* the call blocks until the dma transfer is finished, other threads may run meanwhile */
+  Py_BEGIN_ALLOW_THREADS
   result = (int)ws2811_wait(arg1);
+  Py_END_ALLOW_THREADS
   resultobj = SWIG_From_int((int)(result));
   return resultobj;
 fail:
@@ -3943,6 +3973,69 @@ fail:
 }
 
 
+SWIGINTERN PyObject *_wrap_ws2811_led_set_buffer(PyObject *SWIGUNUSEDPARM(self), PyObject *args) {
+  PyObject *resultobj = 0;
+  ws2811_channel_t *arg1 = (ws2811_channel_t *) 0 ;
+  int arg2 ;
+  Py_buffer view3 ;
+  void *argp1 = 0 ;
+  int res1 = 0 ;
+  PyObject * obj0 = 0 ;
+  PyObject * obj2 = 0 ;
+  int result;
+  
+  if (!PyArg_ParseTuple(args,(char *)"OiO:ws2811_led_set_buffer",&obj0,&arg2,&obj2)) SWIG_fail;
+  res1 = SWIG_ConvertPtr(obj0, &argp1,SWIGTYPE_p_ws2811_channel_t, 0 |  0 );
+  if (!SWIG_IsOK(res1)) {
+    SWIG_exception_fail(SWIG_ArgError(res1), "in method '" "ws2811_led_set_buffer" "', argument " "1"" of type '" "ws2811_channel_t *""'"); 
+  }
+  arg1 = (ws2811_channel_t *)(argp1);
+  if (PyObject_GetBuffer(obj2, &view3, PyBUF_ANY_CONTIGUOUS) != 0) SWIG_fail;
+  if (view3.len % sizeof(ws2811_led_t) != 0) {
+    PyBuffer_Release(&view3);
+    SWIG_exception_fail(SWIG_ValueError, "in method '" "ws2811_led_set_buffer" "', argument " "3"" must contain whole 32-bit led values");
+  }
+  result = (int)ws2811_led_set_buffer(arg1,arg2,view3.buf,(size_t)(view3.len / sizeof(ws2811_led_t)));
+  PyBuffer_Release(&view3);
+  resultobj = SWIG_From_int((int)(result));
+  return resultobj;
+fail:
+  return NULL;
+}
+
+
+SWIGINTERN PyObject *_wrap_ws2811_led_get_buffer(PyObject *SWIGUNUSEDPARM(self), PyObject *args) {
+  PyObject *resultobj = 0;
+  ws2811_channel_t *arg1 = (ws2811_channel_t *) 0 ;
+  int arg2 ;
+  int arg3 ;
+  void *argp1 = 0 ;
+  int res1 = 0 ;
+  PyObject * obj0 = 0 ;
+  int result;
+  
+  if (!PyArg_ParseTuple(args,(char *)"Oii:ws2811_led_get_buffer",&obj0,&arg2,&arg3)) SWIG_fail;
+  res1 = SWIG_ConvertPtr(obj0, &argp1,SWIGTYPE_p_ws2811_channel_t, 0 |  0 );
+  if (!SWIG_IsOK(res1)) {
+    SWIG_exception_fail(SWIG_ArgError(res1), "in method '" "ws2811_led_get_buffer" "', argument " "1"" of type '" "ws2811_channel_t *""'"); 
+  }
+  arg1 = (ws2811_channel_t *)(argp1);
+  if (arg3 < 0) {
+    SWIG_exception_fail(SWIG_ValueError, "in method '" "ws2811_led_get_buffer" "', argument " "3"" must not be negative");
+  }
+  resultobj = PyBytes_FromStringAndSize(NULL, (Py_ssize_t)arg3 * sizeof(ws2811_led_t));
+  if (!resultobj) SWIG_fail;
+  result = (int)ws2811_led_get_buffer(arg1,arg2,PyBytes_AS_STRING(resultobj),(size_t)arg3);
+  if (result != 0) {
+    Py_DECREF(resultobj);
+    SWIG_exception_fail(SWIG_IndexError, "in method '" "ws2811_led_get_buffer" "', the requested leds are outside of the channel");
+  }
+  return resultobj;
+fail:
+  return NULL;
+}
+
+
 SWIGINTERN PyObject *_wrap_ws2811_channel_get(PyObject *SWIGUNUSEDPARM(self), PyObject *args) {
   PyObject *resultobj = 0;
   ws2811_t *arg1 = (ws2811_t *) 0 ;
@@ -4006,6 +4099,8 @@ static PyMethodDef SwigMethods[] = {
 	 { (char *)"ws2811_wait", _wrap_ws2811_wait, METH_VARARGS, NULL},
 	 { (char *)"ws2811_led_get", _wrap_ws2811_led_get, METH_VARARGS, NULL},
 	 { (char *)"ws2811_led_set", _wrap_ws2811_led_set, METH_VARARGS, NULL},
+	 { (char *)"ws2811_led_set_buffer", _wrap_ws2811_led_set_buffer, METH_VARARGS, NULL},
+	 { (char *)"ws2811_led_get_buffer", _wrap_ws2811_led_get_buffer, METH_VARARGS, NULL},
 	 { (char *)"ws2811_channel_get", _wrap_ws2811_channel_get, METH_VARARGS, NULL},
 	 { NULL, NULL, 0, NULL }
 };